@@ -1,23 +1,23 @@
 import os
 from langchain.agents import initialize_agent, Tool
 from langchain_openai import ChatOpenAI
-from openai import OpenAI
 from db import save_feedback as db_save_feedback
+from logging_config import get_logger
+
+logger = get_logger("agent")
 
 # Set Unicode encoding environment variable
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 
 def save_feedback(data):
     """Wrapper function to ensure data is passed as dictionary to db_save_feedback."""
-    print(f"AGENT save_feedback wrapper - Data type: {type(data)}")
-    print(f"AGENT save_feedback wrapper - Data preview: {str(data)[:100]}...")
+    logger.debug("save_feedback called with %s: %.100s", type(data).__name__, data)
     
     # If data is a string representation of a dict, convert it
     if isinstance(data, str):
         try:
             # Try to parse as JSON first
             data = json.loads(data)
-            print("AGENT: JSON parsing succeeded")
         except json.JSONDecodeError:
             try:
                 # Handle string representations like "{'key': 'value'}"
@@ -25,53 +25,143 @@ def save_feedback(data):
                     # Replace None with null for JSON parsing
                     json_str = data.replace('None', 'null').replace("'", '"')
                     data = json.loads(json_str)
-                    print("AGENT: String-to-dict conversion succeeded")
                 else:
-                    print("AGENT: Not a string dictionary format")
+                    logger.warning("save_feedback received text that is not a dictionary")
             except Exception as e:
-                print(f"AGENT: Conversion failed: {e}")
-    
-    print(f"AGENT: Final data type: {type(data)}")
-    print(f"AGENT: Final data keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}")
+                logger.warning("save_feedback could not convert its input to a dictionary: %s", e)
     
-    # Log image_url before saving
     if isinstance(data, dict):
-        image_url_value = data.get('image_url')
-        print(f"[AGENT_SAVE] Image URL in data being saved: {image_url_value}")
-        print(f"[AGENT_SAVE] Image URL type: {type(image_url_value)}")
-        if image_url_value:
-            print(f"[AGENT_SAVE] ✓ Image URL will be saved to MongoDB: {image_url_value}")
-        else:
-            print(f"[AGENT_SAVE] ✗ WARNING: Image URL is None or missing!")
+        logger.debug("Saving record with image_url=%s: %s", data.get('image_url'), data)
     
     # Call the actual db function
     result = db_save_feedback(data)
-    print(f"[AGENT_SAVE] Database save result: {result}")
+    logger.debug("Database save result: %s", result)
     return result
 import os
 from dotenv import load_dotenv
 import json
 import io
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass
 from pydub import AudioSegment
+from pydub.silence import detect_silence
+from pydub.utils import mediainfo_json
+from cache import LRUCache, DiskCache, TieredCache, content_hash
+from backends import get_transcriber, get_extractor
+from metrics import stage_timer, FALLBACKS, RECORDINGS, PIPELINES_IN_FLIGHT
+from schema import build_prompt, default_record, normalize_record, SCHEMA_VERSION
 
 load_dotenv()
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY missing in environment")
+# ---- REQUEST CONTEXT ----
+@dataclass
+class ProcessingContext:
+    """Audio and image for one request, shared by the tools instead of module globals."""
+    audio_file: object = None
+    filename: str = "audio_file"
+    image_data: dict = None
+
+# Each request (thread or asyncio task) sees only its own context
+_processing_context = ContextVar("processing_context", default=None)
 
-openai_client = OpenAI(api_key=openai_api_key)
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+def get_processing_context():
+    """Return the context of the request being processed, or an empty one."""
+    return _processing_context.get() or ProcessingContext()
+
+# ---- CACHES ----
+# Transcripts keyed by a hash of the audio bytes, so a re-uploaded recording is not sent to Whisper again
+TRANSCRIPT_CACHE_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_ENTRIES", "512"))
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", "cache/transcripts")
+TRANSCRIPT_CACHE_DISK_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_DISK_ENTRIES", "10000"))
+TRANSCRIPT_CACHE_TTL_SECONDS = int(os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+transcript_cache = TieredCache(
+    LRUCache(TRANSCRIPT_CACHE_ENTRIES, ttl_seconds=TRANSCRIPT_CACHE_TTL_SECONDS),
+    DiskCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_DISK_ENTRIES, ttl_seconds=TRANSCRIPT_CACHE_TTL_SECONDS)
+    if TRANSCRIPT_CACHE_DIR else None,
+)
+
+# ---- AUDIO PREPROCESSING ----
+# "compact": send compressed formats Whisper accepts unchanged and transcode anything else
+#            (including uncompressed WAV) to 16 kHz mono
+# "wav": decode and re-export everything as uncompressed WAV (previous behaviour)
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "compact").strip().lower()
+COMPACT_AUDIO_FORMAT = os.getenv("COMPACT_AUDIO_FORMAT", "flac").strip().lower()  # "flac" or "opus"
+WHISPER_FORMATS = {"flac", "m4a", "mp3", "mp4", "mpeg", "mpga", "oga", "ogg", "webm"}
+
+# ---- LONG RECORDINGS ----
+# Recordings longer than the threshold are split at pauses and the chunks transcribed in parallel
+LONG_AUDIO_THRESHOLD_SECONDS = int(os.getenv("LONG_AUDIO_THRESHOLD_SECONDS", "300"))
+LONG_AUDIO_CHUNK_SECONDS = int(os.getenv("LONG_AUDIO_CHUNK_SECONDS", "120"))
+# Uploads smaller than this are never probed for their duration
+LONG_AUDIO_PROBE_BYTES = int(os.getenv("LONG_AUDIO_PROBE_BYTES", str(1024 * 1024)))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+# Chunk transcriptions in flight across all requests, jobs and batches of this process
+TRANSCRIBE_MAX_CHUNKS_IN_FLIGHT = int(os.getenv("TRANSCRIBE_MAX_CHUNKS_IN_FLIGHT", "8"))
+# Recordings longer than this are rejected, by ffprobe before decoding where the container has a duration; 0 disables the check
+MAX_AUDIO_DURATION_SECONDS = int(os.getenv("MAX_AUDIO_DURATION_SECONDS", "1800"))
+
+# Audio that is transcoded or split is decoded as 16 kHz mono, all Whisper needs for speech, instead of at its own rate
+SPEECH_DECODE_PARAMETERS = ["-ac", "1", "-ar", "16000"]
+
+class AudioTooLongError(ValueError):
+    """The recording is longer than MAX_AUDIO_DURATION_SECONDS."""
+
+def _check_duration(seconds):
+    if MAX_AUDIO_DURATION_SECONDS and seconds > MAX_AUDIO_DURATION_SECONDS:
+        raise AudioTooLongError(
+            f"Recording is {seconds:.0f}s long, the limit is {MAX_AUDIO_DURATION_SECONDS}s"
+        )
+
+def _probe_duration(file_obj):
+    """
+    Duration in seconds as ffprobe reads it from the container, without decoding
+    the audio. None when it is unknown, e.g. for streamed WebM without a duration.
+    """
+    # Files opened from disk (jobs, batches) are probed by path; anything else is piped to ffprobe
+    path = getattr(file_obj, 'name', None)
+    try:
+        if not (isinstance(path, str) and os.path.isfile(path)
+                and os.path.samestat(os.fstat(file_obj.fileno()), os.stat(path))):
+            path = file_obj
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        path = file_obj
+    try:
+        return float(mediainfo_json(path)["format"]["duration"])
+    except Exception as e:
+        logger.debug("Could not probe the audio duration: %s", e)
+        return None
+    finally:
+        file_obj.seek(0)
+
+def _upload_name(file_obj):
+    """
+    Name to send the file under. Uploads are passed as spooled or on-disk file
+    handles whose own name is a temp path or descriptor, so fall back to the
+    request filename when the handle has no usable extension.
+    """
+    name = getattr(file_obj, 'name', None)
+    if isinstance(name, str) and os.path.splitext(name)[1]:
+        return os.path.basename(name)
+    return get_processing_context().filename
 
 # ---- TOOLS ----
-def transcribe_audio(input_param=None):
-    """Transcribe customer feedback audio."""
-    global current_audio_file
-    audio_file = current_audio_file or input_param
+def transcribe_audio(input_param=None, cache_key=None):
+    """
+    Transcribe customer feedback audio. The transcript is cached under the hash of
+    the uploaded recording, not of the converted file, unless cache_key is given.
+    """
+    current_audio_file = get_processing_context().audio_file
+    # The direct pipeline hands over the converted file; the agent passes text, so use the context
+    audio_file = input_param if hasattr(input_param, 'read') else (current_audio_file or input_param)
     if not audio_file:
         return "Error: No audio file found"
     
-    print(f"Transcribing audio file: {getattr(audio_file, 'name', 'unknown')}")
+    logger.debug("Transcribing audio file: %s", _upload_name(audio_file) if hasattr(audio_file, 'read') else 'bytes')
     
     if hasattr(audio_file, 'read'):
         audio_file.seek(0)
@@ -81,24 +171,126 @@ def transcribe_audio(input_param=None):
         file_obj.name = "audio.wav"
     
     try:
-        transcript = openai_client.audio.transcriptions.create(
-            model="whisper-1",
-            file=file_obj
-        )
-        print(f"Transcription successful: {len(transcript.text)} characters")
-        return transcript.text
+        cache_key = cache_key or transcript_cache_key(current_audio_file or file_obj)
+        cached = transcript_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Transcript cache hit: %d characters", len(cached))
+            logger.debug("Transcript cache stats: %s", transcript_cache.stats())
+            return cached
+        
+        long_audio = _load_long_audio(file_obj)
+        if long_audio is not None:
+            text = _transcribe_chunks(long_audio)
+        else:
+            text = _whisper_transcribe(file_obj)
+        logger.debug("Transcription successful: %d characters", len(text))
+        logger.debug("Transcript: %s", text)
+        transcript_cache.set(cache_key, text)
+        return text
     except Exception as e:
-        print(f"Transcription error: {e}")
+        logger.error("Transcription error: %s", e)
         return f"Error transcribing audio: {e}"
 
+def transcript_cache_key(audio):
+    """Transcript cache key for an uploaded recording (file object or bytes)."""
+    return _cache_key(content_hash(audio), get_transcriber())
+
+def _cache_key(key, backend):
+    """Keep results of non-default backends apart, so fake output never reaches real requests."""
+    return key if backend.name == "openai" else f"{backend.name}_{key}"
+
+def _whisper_transcribe(file_obj):
+    """Send one audio file to the transcription backend and return the text."""
+    with stage_timer("whisper"):
+        return get_transcriber().transcribe(file_obj, _upload_name(file_obj))
+
+def _load_long_audio(file_obj):
+    """
+    Decode the audio as 16 kHz mono if it is longer than LONG_AUDIO_THRESHOLD_SECONDS;
+    None for short clips. The duration is probed first, so short clips are never decoded.
+    """
+    file_obj.seek(0, io.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    if size < LONG_AUDIO_PROBE_BYTES:
+        return None
+    duration = _probe_duration(file_obj)
+    if duration is not None:
+        _check_duration(duration)
+        if duration <= LONG_AUDIO_THRESHOLD_SECONDS:
+            return None
+    try:
+        audio = AudioSegment.from_file(file_obj, parameters=SPEECH_DECODE_PARAMETERS)
+    except Exception as e:
+        logger.warning("Could not decode audio to check its length, sending it whole: %s", e)
+        return None
+    finally:
+        file_obj.seek(0)
+    # Recordings without a duration in their container are only measured once decoded
+    _check_duration(audio.duration_seconds)
+    if audio.duration_seconds <= LONG_AUDIO_THRESHOLD_SECONDS:
+        return None
+    return audio
+
+def split_at_silence(audio, max_chunk_ms, min_silence_ms=500):
+    """
+    Yield chunks of audio of at most max_chunk_ms, cutting in the middle of the
+    last pause before each limit. Cuts mid-speech only when there is no pause.
+    Chunks are sliced as they are consumed, so only those in use are in memory.
+    """
+    silences = detect_silence(audio, min_silence_len=min_silence_ms, silence_thresh=audio.dBFS - 16, seek_step=100)
+    cut_points = [(start + end) // 2 for start, end in silences]
+    
+    start = 0
+    while len(audio) - start > max_chunk_ms:
+        limit = start + max_chunk_ms
+        # Prefer a pause in the second half of the window so chunks do not get too small
+        candidates = [cut for cut in cut_points if start + max_chunk_ms // 2 < cut <= limit]
+        cut = candidates[-1] if candidates else limit
+        yield audio[start:cut]
+        start = cut
+    yield audio[start:]
+
+_chunk_slots = threading.BoundedSemaphore(max(1, TRANSCRIBE_MAX_CHUNKS_IN_FLIGHT))
+
+def _transcribe_chunk(chunk):
+    compact = _export_compact(chunk)
+    # Long recordings of concurrent requests share the process-wide limit, so they cannot add up to a burst of Whisper calls
+    with _chunk_slots:
+        return _whisper_transcribe(compact)
+
+def _transcribe_chunks(audio):
+    """
+    Transcribe a long recording chunk by chunk, at most TRANSCRIBE_CONCURRENCY at a
+    time, and at most TRANSCRIBE_MAX_CHUNKS_IN_FLIGHT for all recordings together.
+    """
+    concurrency = max(1, TRANSCRIBE_CONCURRENCY)
+    texts, pending = [], deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for chunk in split_at_silence(audio, LONG_AUDIO_CHUNK_SECONDS * 1000):
+            # Each chunk runs in a copy of this request's context (request id, processing context)
+            pending.append(executor.submit(copy_context().run, _transcribe_chunk, chunk))
+            del chunk
+            # Slice the next chunk only once a worker is free for it, so at most
+            # `concurrency` chunks and their exports are held at a time
+            if len(pending) >= concurrency:
+                texts.append(pending.popleft().result())
+        # Results are collected in submission order, so the texts can be joined directly
+        texts.extend(future.result() for future in pending)
+    logger.info("Long recording (%.0fs): transcribed %d chunks", audio.duration_seconds, len(texts))
+    return " ".join(text.strip() for text in texts if text.strip())
+
 def convert_audio_format(input_param=None):
-    """Convert audio to WAV if needed."""
-    global current_audio_file
-    audio_file = current_audio_file or input_param
+    """Prepare audio for Whisper according to AUDIO_PREPROCESS."""
+    with stage_timer("convert"):
+        return _convert_audio_format(input_param)
+
+def _convert_audio_format(input_param=None):
+    audio_file = get_processing_context().audio_file or input_param
     if not audio_file:
         return "Error: No audio file found"
     
-    print(f"Converting audio file: {getattr(audio_file, 'name', 'unknown')}")
+    logger.debug("Converting audio file: %s", _upload_name(audio_file) if hasattr(audio_file, 'read') else 'bytes')
     
     try:
         if hasattr(audio_file, 'read'):
@@ -108,151 +300,101 @@ def convert_audio_format(input_param=None):
             file_obj = io.BytesIO(audio_file)
             file_obj.name = "audio.wav"
         
+        if AUDIO_PREPROCESS == "compact":
+            extension = os.path.splitext(_upload_name(file_obj))[1].lower().lstrip('.')
+            if extension in WHISPER_FORMATS:
+                logger.debug("Audio format '%s' is accepted by Whisper, sending it unchanged", extension)
+                return file_obj
+            # Reject over-long recordings from the header, before any of the audio is decoded
+            duration = _probe_duration(file_obj)
+            if duration is not None:
+                _check_duration(duration)
+            # The export is 16 kHz mono anyway, so decode straight to it
+            audio = AudioSegment.from_file(file_obj, parameters=SPEECH_DECODE_PARAMETERS)
+            if duration is None:
+                _check_duration(audio.duration_seconds)
+            return _export_compact(audio)
+        
+        duration = _probe_duration(file_obj)
+        if duration is not None:
+            _check_duration(duration)
         audio = AudioSegment.from_file(file_obj)
+        if duration is None:
+            _check_duration(audio.duration_seconds)
         wav_buffer = io.BytesIO()
         audio.export(wav_buffer, format="wav")
         wav_buffer.seek(0)
         wav_buffer.name = "converted_audio.wav"
-        print(f"Audio conversion successful")
+        logger.debug("Audio converted to WAV")
         return wav_buffer
+    except AudioTooLongError as e:
+        logger.warning("Audio rejected: %s", e)
+        return f"Error: {e}"
     except Exception as e:
-        print(f"Audio conversion failed: {e}")
+        logger.warning("Audio conversion failed, sending the original file: %s", e)
         # Return original file if conversion fails
         if hasattr(audio_file, 'seek'):
             audio_file.seek(0)
         return audio_file
 
+def _export_compact(audio):
+    """Export audio as 16 kHz mono in COMPACT_AUDIO_FORMAT, which is all Whisper needs for speech."""
+    audio = audio.set_frame_rate(16000).set_channels(1)
+    buffer = io.BytesIO()
+    if COMPACT_AUDIO_FORMAT == "opus":
+        audio.export(buffer, format="ogg", codec="libopus", bitrate="24k")
+        buffer.name = "converted_audio.ogg"
+    else:
+        audio.export(buffer, format="flac")
+        buffer.name = "converted_audio.flac"
+    buffer.seek(0)
+    logger.debug("Audio converted: %d bytes as %s", buffer.getbuffer().nbytes, buffer.name)
+    return buffer
+
+def build_extraction_prompt(feedback_text, current_image_data=None):
+    """Build the gpt-4o-mini prompt for a transcript, or for an image-only upload."""
+    return build_prompt(feedback_text, current_image_data["filename"] if current_image_data else None)
+
+def extraction_cache_key(feedback_text, image_data=None):
+    """Cache key from the normalized transcript, the image context and the schema version."""
+    normalized = " ".join(feedback_text.split())
+    image_name = image_data["filename"] if image_data else ""
+    return content_hash(f"{EXTRACTION_PROMPT_VERSION}\n{image_name}\n{normalized}".encode("utf-8"))
+
+# Extractions keyed on transcript, image and schema version; skips the LLM call for re-processed text
+EXTRACTION_CACHE_ENTRIES = int(os.getenv("EXTRACTION_CACHE_ENTRIES", "1024"))
+EXTRACTION_PROMPT_VERSION = SCHEMA_VERSION
+extraction_cache = LRUCache(EXTRACTION_CACHE_ENTRIES)
+
 def extract_feedback(feedback_text: str):
     """Extract structured feedback fields from the transcript or image context."""
-    global current_image_data
+    current_image_data = get_processing_context().image_data
+    image_url = None
     
     try:
-        image_context = ""
         if current_image_data:
-            image_context = f"\n\nAn image file '{current_image_data['filename']}' is also provided for additional context. Include any relevant image information in the feedback."
             # Use image URL from image_data if provided (handled separately in app.py), otherwise generate it
             if 'image_url' in current_image_data and current_image_data['image_url']:
                 image_url = current_image_data['image_url']
-                print(f"[AGENT] Using provided image URL: {image_url}")
             else:
                 # Fallback: Generate image URL if not provided
                 image_url = f"/images/{current_image_data['unique_filename']}"
-                print(f"[AGENT] Generated image URL: {image_url}")
-            print(f"[AGENT] Image unique filename: {current_image_data['unique_filename']}")
-        else:
-            image_url = None
-            print(f"[AGENT] No image data available")
+            logger.debug("Image URL for record: %s", image_url)
         
-        # Check if this is an image-only upload
-        is_image_only = feedback_text.startswith("Image-only upload:")
+        # Reuse a previous extraction of the same transcript and image with the same schema
+        cache_key = _cache_key(extraction_cache_key(feedback_text, current_image_data), get_extractor())
+        cached = extraction_cache.get(cache_key)
+        if cached is not None:
+            parsed_data = dict(cached)
+            logger.debug("Extraction cache hit: %d fields", len(parsed_data))
+            logger.debug("Extraction cache stats: %s", extraction_cache.stats())
+            # FORCE image_url from the upload; it is never taken from the model
+            parsed_data["image_url"] = image_url
+            return parsed_data
         
-        if is_image_only:
-            prompt = f"""
-            You are an assistant that extracts structured feedback data from jewellery store customer images.
-            
-            An image file '{current_image_data['filename']}' has been uploaded for customer feedback analysis.{image_context}
-            
-            Extract as JSON with the following fields:
-            {{
-                "purchased": "Yes" | "No" | null,
-                "salesperson_name": string or null,
-                "item_type": "Bangle" | "Chain" | "Bracelet" | "Necklace" | "Earring" | "Ring" | "Pendant Set" | "Stud" | "Locket" | "Hand Chain" | "Nose Pin" | "Mangal Sutra" | "Thali" | "Band Ring" | null,
-                "metal_type": "22K" | "18K" | "24K" | "Diamond" | "Other" | null,
-                "reason_price": "Yes" | "No" | null,
-                "reason_size": "Yes" | "No" | null,
-                "reason_weight": "Yes" | "No" | null,
-                "reason_zeromaking": "Yes" | "No" | null,
-                "reason_design_outofstock": "Yes" | "No" | null,
-                "reason_design_new": "Yes" | "No" | null,
-                "required_size": number or null,
-                "required_weight": number or null,
-                "available_size": number or null,
-                "available_weight": number or null,
-                "asked_price": number or null,
-                "given_price": number or null,
-                "design_type": "Coins / Bars" | "Daily Wear" | "Custom Order" | "Bridal jewellery" | "Kids Jewellery" | "Men's Jewellery" | "Temple" | "Antique" | "Turkish" | "Calcutta" | "Delhi" | "Rajkot" | "Local" | "Singapore" | "Bombay" | "Italian" | null,
-                "item_category": string or null,
-                "customer_intent": "Just Looking" | "Serious Buyer" | "Price Checking" | "Return Customer" | null,
-                "is_previous_cust": "Yes" | "No" | null,
-                "type_of_customer": "tourist" | "resident" | "none" | null,
-                "M_Source": "walkin" | "Social Media" | "Social Groups" | "Whatsup Groups" | "Corporates" | "Residential Cmty" | "Local Cmty" | "HNTW" | "Hotels" | "Tourism Companies" | "Tour Drivers" | "Other Tours Assctd cmpy" | "DGJG" | "Product Launch" | "Other" | "none" | null,
-                "M_source_Tag": string or null,
-                "design_preference": "Liked" | "Disliked" | "Neutral" | null,
-                "store_impression": "Good" | "Poor" | "Neutral" | null,
-                "customer_mood": "Happy" | "Frustrated" | "Neutral" | "Disappointed" | null,
-                "customer_support": "Excellent" | "Good" | "Average" | "Poor" | null,
-                "purchase_satisfaction": "Very Satisfied" | "Satisfied" | "Neutral" | "Dissatisfied" | null,
-                "waiting_time": "Very Fast" | "Fast" | "Average" | "Slow" | "Very Slow" | null,
-                "original_text": "Image-only upload: {current_image_data['filename']}",
-                "contact_number": string or null
-            }}
-            
-            Since this is an image-only upload, analyze the image context and extract any visible information about:
-            - Jewelry items shown
-            - Customer interactions
-            - Store environment
-            - Any text or labels visible in the image
-            
-            If a field cannot be determined from the image, set it to null.
-            Return ONLY valid JSON without any markdown formatting or code blocks.
-            """
-        else:
-            prompt = f"""
-            You are an assistant that extracts structured feedback data from jewellery store customer conversations.
-            
-            Analyze this text:
-            "{feedback_text}"{image_context}
-            
-            Extract as JSON with the following fields:
-            {{
-                "purchased": "Yes" | "No" | null,
-                "salesperson_name": string or null,
-                "item_type": "Bangle" | "Chain" | "Bracelet" | "Necklace" | "Earring" | "Ring" | "Pendant Set" | "Stud" | "Locket" | "Hand Chain" | "Nose Pin" | "Mangal Sutra" | "Thali" | "Band Ring" | null,
-                "metal_type": "22K" | "18K" | "24K" | "Diamond" | "Other" | null,
-                "reason_price": "Yes" | "No" | null,
-                "reason_size": "Yes" | "No" | null,
-                "reason_weight": "Yes" | "No" | null,
-                "reason_zeromaking": "Yes" | "No" | null,
-                "reason_design_outofstock": "Yes" | "No" | null,
-                "reason_design_new": "Yes" | "No" | null,
-                "required_size": number or null,
-                "required_weight": number or null,
-                "available_size": number or null,
-                "available_weight": number or null,
-                "asked_price": number or null,
-                "given_price": number or null,
-                "design_type": "Coins / Bars" | "Daily Wear" | "Custom Order" | "Bridal jewellery" | "Kids Jewellery" | "Men's Jewellery" | "Temple" | "Antique" | "Turkish" | "Calcutta" | "Delhi" | "Rajkot" | "Local" | "Singapore" | "Bombay" | "Italian" | null,
-                "item_category": string or null,
-                "customer_intent": "Just Looking" | "Serious Buyer" | "Price Checking" | "Return Customer" | null,
-                "is_previous_cust": "Yes" | "No" | null,
-                "type_of_customer": "tourist" | "resident" | "none" | null,
-                "M_Source": "walkin" | "Social Media" | "Social Groups" | "Whatsup Groups" | "Corporates" | "Residential Cmty" | "Local Cmty" | "HNTW" | "Hotels" | "Tourism Companies" | "Tour Drivers" | "Other Tours Assctd cmpy" | "DGJG" | "Product Launch" | "Other" | "none" | null,
-                "M_source_Tag": string or null,
-                "design_preference": "Liked" | "Disliked" | "Neutral" | null,
-                "store_impression": "Good" | "Poor" | "Neutral" | null,
-                "customer_mood": "Happy" | "Frustrated" | "Neutral" | "Disappointed" | null,
-                "customer_support": "Excellent" | "Good" | "Average" | "Poor" | null,
-                "purchase_satisfaction": "Very Satisfied" | "Satisfied" | "Neutral" | "Dissatisfied" | null,
-                "waiting_time": "Very Fast" | "Fast" | "Average" | "Slow" | "Very Slow" | null,
-                "original_text": string,
-                "contact_number": string or null
-            }}
-            
-            Important distinction for design fields:
-            - "reason_design_outofstock": Customer wanted a design that exists in catalog but is currently out of stock
-            - "reason_design_new": Customer requested a new/custom design that does not exist in the catalog
-            
-            Valid item_type values: "Bangle", "Chain", "Bracelet", "Necklace", "Earring", "Ring", "Pendant Set", "Stud", "Locket", "Hand Chain", "Nose Pin", "Mangal Sutra", "Thali", "Band Ring"
-            Valid design_type values: "Coins / Bars", "Daily Wear", "Custom Order", "Bridal jewellery", "Kids Jewellery", "Men's Jewellery", "Temple", "Antique", "Turkish", "Calcutta", "Delhi", "Rajkot", "Local", "Singapore", "Bombay", "Italian"
-            
-            If a field is not mentioned, set it to null.
-            Return ONLY valid JSON without any markdown formatting or code blocks.
-            """
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        text = response.choices[0].message.content.strip()
+        prompt = build_extraction_prompt(feedback_text, current_image_data)
+        with stage_timer("llm_extract"):
+            text = get_extractor().complete(prompt).strip()
         
         # Clean the response - remove markdown formatting
         if text.startswith("```json"):
@@ -266,90 +408,24 @@ def extract_feedback(feedback_text: str):
         
         # Parse JSON to ensure it's valid
         try:
-            parsed_data = json.loads(text)
-            print(f"Feedback extraction successful: {len(parsed_data)} fields extracted")
-            
-            # FORCE image_url after AI extraction (override any AI-generated values)
-            # This is handled separately in app.py and should NOT be modified by AI
-            if image_url:
-                parsed_data["image_url"] = image_url
-                print(f"[AGENT] FORCED image_url to: {image_url} (overriding AI value if any)")
-            
-            print(f"[AGENT] Final image_url in parsed_data: {parsed_data.get('image_url')}")
-            
-            return parsed_data  # Return dictionary, not string
+            raw_data = json.loads(text)
         except json.JSONDecodeError as e:
-            print(f"JSON parsing failed: {e}")
-            print(f"Raw response: {text}")
-            # Return a fallback structure
-            return {
-                "purchased": None,
-                "salesperson_name": None,
-                "item_type": None,
-                "metal_type": None,
-                "reason_price": None,
-                "reason_size": None,
-                "reason_weight": None,
-                "reason_zeromaking": None,
-                "reason_design_outofstock": None,
-                "reason_design_new": None,
-                "required_size": None,
-                "required_weight": None,
-                "available_size": None,
-                "available_weight": None,
-                "asked_price": None,
-                "given_price": None,
-                "design_type": None,
-                "item_category": None,
-                "customer_intent": None,
-                "is_previous_cust": None,
-                "type_of_customer": None,
-                "M_Source": None,
-                "M_source_Tag": None,
-                "design_preference": None,
-                "store_impression": None,
-                "customer_mood": None,
-                "customer_support": None,
-                "purchase_satisfaction": None,
-                "waiting_time": None,
-                "original_text": feedback_text,  # Store original text
-                "contact_number": None,
-                "image_url": image_url
-            }
+            logger.error("Extraction response is not valid JSON: %s", e)
+            logger.debug("Raw extraction response: %s", text)
+            return default_record(feedback_text, image_url)
+        
+        # Coerce to the schema: all fields present, enum values in their canonical spelling
+        parsed_data, rejected = normalize_record(raw_data, feedback_text, image_url)
+        if rejected:
+            logger.warning("Extraction values outside the schema set to null: %s", rejected)
+        logger.debug("Feedback extraction successful: %d fields extracted", sum(value is not None for value in parsed_data.values()))
+        extraction_cache.set(cache_key, dict(parsed_data))
+        logger.debug("Extracted record: %s", parsed_data)
+        return parsed_data  # Return dictionary, not string
         
     except Exception as e:
-        print(f"Feedback extraction error: {e}")
-        return {
-            "purchased": None,
-            "salesperson_name": None,
-            "item_type": None,
-            "metal_type": None,
-            "reason_price": None,
-            "reason_size": None,
-            "reason_weight": None,
-            "reason_zeromaking": None,
-            "reason_design_outofstock": None,
-            "reason_design_new": None,
-            "required_size": None,
-            "required_weight": None,
-            "available_size": None,
-            "available_weight": None,
-            "asked_price": None,
-            "given_price": None,
-            "design_type": None,
-            "item_category": None,
-            "customer_intent": None,
-            "is_previous_cust": None,
-            "design_preference": None,
-            "store_impression": None,
-            "customer_mood": None,
-            "customer_support": None,
-            "purchase_satisfaction": None,
-            "waiting_time": None,
-            "original_text": f"Error extracting feedback: {e}",
-            "contact_number": None,
-            "image_url": image_url
-        }
+        logger.error("Feedback extraction error: %s", e)
+        return default_record(f"Error extracting feedback: {e}", image_url)
 
 # Register tools
 tools = [
@@ -359,37 +435,59 @@ tools = [
     Tool(name="save_feedback", func=save_feedback, description="Save structured feedback data into CRM MongoDB database.")
 ]
 
-current_audio_file = None
-current_image_data = None
-agent = initialize_agent(
-    tools,
-    llm,
-    agent_type="zero-shot-react-description",
-    verbose=False,  # Disable verbose output to prevent Unicode issues
-    handle_parsing_errors=True,
-)
+# Pipeline mode: "direct" runs the four tools in code, "agent" lets the ReAct agent plan them
+PIPELINE_MODES = ("direct", "agent")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "direct").strip().lower()
+if PIPELINE_MODE not in PIPELINE_MODES:
+    logger.warning("Unknown PIPELINE_MODE '%s', using 'direct'", PIPELINE_MODE)
+    PIPELINE_MODE = "direct"
 
-def process_audio_with_agent(audio_file, filename="audio_file", image_data=None):
-    global current_audio_file
-    
-    # Set the global audio file and ensure it has proper attributes
-    current_audio_file = audio_file
-    if hasattr(audio_file, 'name'):
-        audio_file.name = filename
-    else:
-        audio_file.name = filename
-    
-    print(f"Audio file set globally: {filename}, size: {len(audio_file.getvalue()) if hasattr(audio_file, 'getvalue') else 'unknown'}")
-    
-    # Store image data globally for tools to access
-    global current_image_data
-    current_image_data = image_data
-    if image_data:
-        print(f"[AGENT] Image data received: filename={image_data.get('filename')}, size={image_data.get('size')} bytes")
-        print(f"[AGENT] Image URL in image_data: {image_data.get('image_url')}")
-        print(f"[AGENT] Unique filename in image_data: {image_data.get('unique_filename')}")
-    else:
-        print(f"[AGENT] No image data received")
+# The agent is only built the first time agent mode is used
+agent = None
+_agent_lock = threading.Lock()
+
+def get_agent():
+    """Create the LangChain agent on first use."""
+    global agent
+    with _agent_lock:
+        if agent is None:
+            # Planning always uses the OpenAI chat model; the tools use the configured backends
+            llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+            agent = initialize_agent(
+                tools,
+                llm,
+                agent_type="zero-shot-react-description",
+                verbose=False,  # Disable verbose output to prevent Unicode issues
+                handle_parsing_errors=True,
+            )
+    return agent
+
+def process_audio_with_agent(audio_file, filename="audio_file", image_data=None, mode=None):
+    """
+    Process an audio recording with the selected pipeline mode.
+    `mode` overrides PIPELINE_MODE for a single request.
+    """
+    mode = (mode or PIPELINE_MODE).strip().lower()
+    if mode not in PIPELINE_MODES:
+        return {"status": "error", "error": f"Unknown pipeline mode: {mode}"}
+
+    # Make the audio and image available to the tools for this request only.
+    # The file is used as given (upload spool, job file or buffer); the tools take its name from the context.
+    context = ProcessingContext(audio_file=audio_file, filename=filename, image_data=image_data)
+    token = _processing_context.set(context)
+    try:
+        return _run_pipeline(context, mode)
+    finally:
+        _processing_context.reset(token)
+
+def _run_pipeline(context, mode):
+    """Run the selected pipeline against the current request context."""
+    audio_file, filename, image_data = context.audio_file, context.filename, context.image_data
+    logger.debug("Processing %s in %s mode%s", filename, mode, " with image" if image_data else "")
+    logger.debug("Image data: %s", image_data)
+
+    if mode == "direct":
+        return process_audio_direct(filename)
 
     prompt = f"""
     The file '{filename}' contains a salesperson-customer conversation.
@@ -413,11 +511,114 @@ def process_audio_with_agent(audio_file, filename="audio_file", image_data=None)
 
     try:
         # Use invoke instead of deprecated run method
-        result = agent.invoke({"input": prompt})
+        result = get_agent().invoke({"input": prompt})
         return {"status": "success", "message": "Processed successfully", "agent_result": result}
     except UnicodeEncodeError as unicode_error:
-        print(f"Unicode encoding error caught: {unicode_error}")
+        logger.error("Unicode encoding error: %s", unicode_error)
+        return {"status": "error", "error": f"Unicode encoding error: {unicode_error}"}
+    except Exception as e:
+        logger.error("Agent error: %s", e)
+        return {"status": "error", "error": str(e)}
+
+
+def process_audio_direct(filename="audio_file"):
+    """
+    Run convert -> transcribe -> extract -> save in code, without LLM planning.
+    Uses the audio and image already set for the tools by process_audio_with_agent.
+    The result includes the time spent in each stage, in milliseconds.
+    """
+    timings = {}
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+    try:
+        # A recording uploaded again is looked up by its raw bytes, so a hit skips the conversion too
+        audio_file = get_processing_context().audio_file
+        cache_key = transcript_cache_key(audio_file) if audio_file else None
+        transcript = transcript_cache.get(cache_key) if cache_key else None
+        if transcript is not None:
+            logger.debug("Transcript cache hit for the upload, skipping conversion")
+        else:
+            converted = timed("convert", convert_audio_format)
+            if isinstance(converted, str) and converted.startswith("Error"):
+                return {"status": "error", "error": converted}
+
+            transcript = timed("transcribe", transcribe_audio, converted, cache_key)
+        if not transcript or transcript.startswith("Error"):
+            return {"status": "error", "error": transcript or "Empty transcript"}
+
+        feedback = timed("extract", extract_feedback, transcript)
+
+        # db.save_feedback adds created_at and _id in place, so keep our copy JSON-safe
+        save_result = timed("save", save_feedback, dict(feedback))
+        logger.info("Direct pipeline completed for %s", filename, extra={"timings_ms": timings})
+        return {
+            "status": "success",
+            "message": "Processed successfully",
+            "agent_result": {
+                "mode": "direct",
+                "transcript": transcript,
+                "feedback": feedback,
+                "output": save_result,
+                "timings_ms": timings,
+            },
+        }
+    except UnicodeEncodeError as unicode_error:
+        logger.error("Unicode encoding error: %s", unicode_error)
         return {"status": "error", "error": f"Unicode encoding error: {unicode_error}"}
     except Exception as e:
-        print(f"Agent error: {e}")
+        logger.error("Direct pipeline error: %s", e)
         return {"status": "error", "error": str(e)}
+
+def fallback_record(original_text, image_data=None):
+    """Empty feedback record saved when the pipeline fails, so the upload is not lost."""
+    return default_record(original_text, image_data.get('image_url') if image_data else None)
+
+def process_recording(audio_file, filename="audio_file", image_data=None, mode=None):
+    """
+    Process a recording and save a basic record if the pipeline fails.
+    Returns the pipeline result, a "partial_success" result when only the
+    fallback record was saved, or an "error" result when both failed.
+    Shared by /process_audio, the background job workers and batches.
+    """
+    with PIPELINES_IN_FLIGHT.track_inprogress():
+        result = _process_recording(audio_file, filename, image_data, mode)
+    RECORDINGS.labels(status=result["status"]).inc()
+    if result["status"] == "partial_success":
+        FALLBACKS.labels(kind="partial_success").inc()
+    elif result.get("fallback_failed"):
+        FALLBACKS.labels(kind="fallback_failed").inc()
+    return result
+
+def _process_recording(audio_file, filename, image_data, mode):
+    try:
+        result = process_audio_with_agent(audio_file, filename, image_data, mode=mode)
+        if result["status"] != "error":
+            return result
+        error = result["error"]
+        original_text = f"Audio processing failed: {error}"
+        message = "Audio processing failed, but basic data saved"
+    except UnicodeEncodeError as unicode_error:
+        logger.error("Unicode encoding error: %s", unicode_error)
+        error = str(unicode_error)
+        original_text = f"Unicode encoding error: {unicode_error}"
+        message = "Unicode encoding error occurred, but basic data saved"
+
+    logger.warning("Processing failed, saving a basic record: %s", error)
+    # Fallback: Try to save basic data even if agent fails
+    try:
+        save_result = db_save_feedback(fallback_record(original_text, image_data))
+        logger.info("Fallback save result: %s", save_result)
+        return {
+            "message": message,
+            "error": error,
+            "status": "partial_success",
+            "fallback_saved": True
+        }
+    except Exception as fallback_error:
+        logger.error("Fallback save also failed: %s", fallback_error)
+        return {"status": "error", "error": error, "fallback_failed": True}
@@ -1,25 +1,114 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import contextvars
+import functools
 import io
+import itertools
+import json
 import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import List
 from dotenv import load_dotenv
+from starlette.formparsers import MultiPartParser
+from jobs import JobQueue
+from images import IMAGES_DIR, ImageStore, variant_urls
+import batch
+import metrics
+from logging_config import get_logger, get_request_id, set_request_id, reset_request_id
 
 load_dotenv()
 
+logger = get_logger("app")
+
 # -----------------------------
 # CONFIGURATION
 # -----------------------------
 app = FastAPI(title="Trichy Gold AI Voice Capture - LangChain Agent")
 
-# Image storage configuration
-IMAGES_DIR = Path("C:\\Users\\shama\\Projects\\crm_agent_images").resolve()
+# Image storage: IMAGES_DIR (default ./images), see images.py
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-print(f"[CONFIG] Images directory: {IMAGES_DIR}")
-print(f"[CONFIG] Images directory exists: {IMAGES_DIR.exists()}")
-print(f"[CONFIG] Images directory absolute: {IMAGES_DIR.absolute()}")
+logger.info("Images directory: %s", IMAGES_DIR)
+image_store = ImageStore(IMAGES_DIR)
+
+# Upload configuration. The form parser streams each uploaded file into a spooled
+# temporary file that moves to disk once it grows past UPLOAD_SPOOL_MAX_MEMORY.
+UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", str(1024 * 1024)))
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_PATHS = {"/process_audio", "/jobs"}
+# Endpoints whose in-flight requests and upload read time are tracked in /metrics
+TRACKED_PATHS = UPLOAD_PATHS | {"/process_batch"}
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_MAX_MEMORY
+
+# A pipeline run (decode, Whisper and chat calls, MongoDB insert) takes seconds, so
+# /process_audio runs it on its own threads. The shared threadpool used for the other
+# endpoints' blocking calls (database reads, image lookups) stays free during uploads.
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "32"))
+pipeline_executor = ThreadPoolExecutor(max_workers=max(1, PIPELINE_WORKERS), thread_name_prefix="pipeline")
+
+async def run_in_pipeline_executor(func, *args, **kwargs):
+    """Run a blocking pipeline call on pipeline_executor in a copy of the request's context."""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(pipeline_executor, call)
+
+class UploadMiddleware:
+    """
+    Reject upload requests whose declared size is over the limit before the body is read,
+    or as soon as more than the limit has been received (chunked uploads have no declared
+    size), and record in-flight uploads and the time taken to receive each upload body.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in TRACKED_PATHS or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] in UPLOAD_PATHS:
+            content_length = dict(scope["headers"]).get(b"content-length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                response = JSONResponse(status_code=413, content={"detail": f"Upload too large (limit {self.max_bytes} bytes)"})
+                await response(scope, receive, send)
+                return
+
+        # The form parser spools the files while it reads the body, so this covers both
+        started = None
+        received = 0
+        limit = self.max_bytes if scope["path"] in UPLOAD_PATHS else None
+        async def timed_receive():
+            nonlocal started, received
+            message = await receive()
+            if message["type"] == "http.request":
+                if started is None:
+                    started = time.perf_counter()
+                received += len(message.get("body", b""))
+                if limit is not None and received > limit:
+                    # Raised inside the form parser, so the request ends with this 413 before more is spooled
+                    raise HTTPException(status_code=413, detail=f"Upload too large (limit {limit} bytes)")
+                if not message.get("more_body"):
+                    metrics.observe_stage("upload_read", time.perf_counter() - started)
+            return message
+
+        with metrics.REQUESTS_IN_FLIGHT.labels(endpoint=scope["path"]).track_inprogress():
+            await self.app(scope, timed_receive, send)
+
+# Room for both files plus the multipart framing
+app.add_middleware(UploadMiddleware, max_bytes=MAX_AUDIO_UPLOAD_BYTES + MAX_IMAGE_UPLOAD_BYTES + 64 * 1024)
 
 # Allow frontend to talk to backend
 app.add_middleware(
@@ -30,6 +119,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class RequestIdMiddleware:
+    """
+    Give every request an id (the client's X-Request-ID, or a new one) that is added
+    to each log line written while handling it and returned in the X-Request-ID header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or None
+        token = set_request_id(request_id)
+        header = (b"x-request-id", get_request_id().encode("latin-1"))
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            reset_request_id(token)
+
+# Outermost, so the id is set for everything below it
+app.add_middleware(RequestIdMiddleware)
+
+# Background job queue for /jobs uploads
+def _run_job(job):
+    """Process one queued upload with the same pipeline as /process_audio."""
+    from agent import process_recording
+    with open(job["audio_path"], "rb") as audio_file:
+        return process_recording(audio_file, job["filename"], job["image_data"], mode=job["mode"])
+
+job_queue = JobQueue(_run_job)
+
+@app.on_event("startup")
+async def startup():
+    job_queue.start()
+    from db import ensure_indexes, backfill_feedback_ids, spool_replayer
+    await run_in_threadpool(ensure_indexes)
+    await run_in_threadpool(backfill_feedback_ids)
+    spool_replayer.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    job_queue.stop()
+    pipeline_executor.shutdown(wait=False)
+    image_store.close(wait=False)
+    from db import close_client, spool_replayer, feedback_spool
+    spool_replayer.stop()
+    close_client()
+    feedback_spool.close()
+
 # -----------------------------
 # ROUTES
 # -----------------------------
@@ -47,6 +193,11 @@ async def api_info():
         "description": "AI-powered CRM agent using LangChain for salesperson audio processing",
         "endpoints": {
             "upload_audio": "/process_audio",
+            "queue_audio": "/jobs",
+            "job_status": "/jobs/{job_id}",
+            "process_batch": "/process_batch",
+            "batch_status": "/process_batch/{batch_id}",
+            "metrics": "/metrics",
             "docs": "/docs",
             "redoc": "/redoc"
         },
@@ -63,305 +214,135 @@ async def api_info():
 async def test_upload(file: UploadFile = File(...), image: UploadFile = File(None)):
     """Test endpoint to debug image upload."""
     try:
-        print(f"[TEST] Received file: {file.filename}")
-        print(f"[TEST] Received image: {image.filename if image else 'None'}")
+        logger.info("Test upload: file=%s, image=%s", file.filename, image.filename if image else None)
         
         if image:
             image_content = await image.read()
-            print(f"[TEST] Image size: {len(image_content)} bytes")
             
             # Save image
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             unique_filename = f"{timestamp}_{image.filename}"
             image_path = IMAGES_DIR / unique_filename
             
-            with open(image_path, "wb") as f:
-                f.write(image_content)
+            await run_in_threadpool(image_path.write_bytes, image_content)
             
-            print(f"[TEST] Image saved: {image_path}")
+            logger.info("Test image saved: %s (%d bytes)", image_path, len(image_content))
             return {"status": "success", "image_saved": unique_filename}
         else:
             return {"status": "success", "image_saved": None}
             
     except Exception as e:
-        print(f"[TEST] Error: {e}")
+        logger.error("Test upload failed: %s", e)
         return {"status": "error", "message": str(e)}
 
+def _upload_size(upload: UploadFile):
+    """Size of a spooled upload, measured without reading it."""
+    upload.file.seek(0, io.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(0)
+    return size
+
+def _check_mode(mode):
+    """Normalized pipeline mode of a request, or None for the default; 400 for an unknown mode."""
+    if mode is None or not mode.strip():
+        return None
+    from agent import PIPELINE_MODES
+    mode = mode.strip().lower()
+    if mode not in PIPELINE_MODES:
+        # Rejected here, before anything is saved: the pipeline would store an empty fallback record
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of: {', '.join(PIPELINE_MODES)}")
+    return mode
+
+def _check_audio_upload(file: UploadFile):
+    """Validate an audio upload and return its size; raises HTTPException if it is unusable."""
+    if not _is_audio_upload(file):
+        logger.warning("Rejected upload: content_type=%s, filename=%s", file.content_type, file.filename)
+        raise HTTPException(status_code=400, detail=f"Please upload an audio file. Received: content_type={file.content_type}, filename={file.filename}")
+    size = _upload_size(file)
+    if size == 0:
+        logger.warning("Rejected empty upload: %s", file.filename)
+        raise HTTPException(status_code=400, detail="Empty file uploaded")
+    if size > MAX_AUDIO_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Audio file too large (limit {MAX_AUDIO_UPLOAD_BYTES} bytes)")
+    return size
+
+def _is_audio_upload(file: UploadFile):
+    """Check the content type and filename of an upload for an audio recording."""
+    return (
+        (file.content_type and file.content_type.startswith('audio/')) or
+        (file.filename and any(file.filename.lower().endswith(ext) for ext in ['.wav', '.mp3', '.m4a', '.webm', '.ogg', '.flac', '.aac'])) or
+        (file.filename and 'audio' in file.filename.lower())
+    )
+
+
+async def _save_image_upload(image):
+    """Store an uploaded image in image_store and return its image_data, or None."""
+    if not (image and image.filename):
+        return None
+    
+    try:
+        # The upload is already spooled; measure it without reading it into memory
+        image_size = _upload_size(image)
+        if image_size > MAX_IMAGE_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image file too large (limit {MAX_IMAGE_UPLOAD_BYTES} bytes)")
+        if image_size == 0:
+            logger.info("Image %s is empty, skipping it", image.filename)
+            return None
+        
+        # Hashing and writing happen in a worker thread; thumbnails are generated in the background
+        image_data = await run_in_threadpool(image_store.save, image.file, image.filename, image.content_type)
+        logger.debug("Image data: %s", image_data)
+        return image_data
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error saving image upload %s", image.filename)
+        return None
+
+
 @app.post("/process_audio")
-async def process_audio(file: UploadFile = File(...), image: UploadFile = File(None)):
+async def process_audio(file: UploadFile = File(...), image: UploadFile = File(None), mode: str = Form(None)):
     """
     Process salesperson audio using LangChain agent.
     Extracts reasons why customers didn't purchase.
     Optionally accepts an image file for additional context.
     Audio recording is REQUIRED.
+    `mode` selects the pipeline for this request: "direct" (default) or "agent".
     """
-    print(f"\n{'='*80}")
-    print(f"[PROCESS_AUDIO] ========== ENDPOINT CALLED ==========")
-    print(f"[PROCESS_AUDIO] File: {file.filename if file else 'None'}")
-    print(f"[PROCESS_AUDIO] Image parameter: {image is not None}")
-    if image:
-        print(f"[PROCESS_AUDIO] Image filename: {image.filename if hasattr(image, 'filename') else 'No filename attr'}")
-    print(f"{'='*80}\n")
+    logger.info(
+        "process_audio: file=%s (%s, %s bytes), image=%s",
+        file.filename, file.content_type, file.size, image.filename if image else None,
+    )
     
     try:
-        # Debug information
-        print(f"[FILE] Received file: filename={file.filename}, content_type={file.content_type}, size={file.size}")
-        print(f"[IMAGE] Image parameter received: {image is not None}")
-        print(f"[IMAGE] Image object: {image}")
-        if image:
-            print(f"[IMAGE] Received image: filename={image.filename}, content_type={image.content_type}, size={image.size}")
-        else:
-            print(f"[IMAGE] No image provided")
-        
         # Audio file validation is REQUIRED
-        is_audio_file = (
-            (file.content_type and file.content_type.startswith('audio/')) or
-            (file.filename and any(file.filename.lower().endswith(ext) for ext in ['.wav', '.mp3', '.m4a', '.webm', '.ogg', '.flac', '.aac'])) or
-            (file.filename and 'audio' in file.filename.lower())
-        )
+        _check_audio_upload(file)
+        mode = _check_mode(mode)
         
-        if not is_audio_file:
-            print(f"[ERROR] File validation failed: content_type={file.content_type}, filename={file.filename}")
-            raise HTTPException(status_code=400, detail=f"Please upload an audio file. Received: content_type={file.content_type}, filename={file.filename}")
-        
-        # Read the file content
-        file_content = await file.read()
-        if len(file_content) == 0:
-            print("[ERROR] Empty file uploaded")
-            raise HTTPException(status_code=400, detail="Empty file uploaded")
-            
-        audio_bytes = io.BytesIO(file_content)
-        audio_bytes.name = file.filename or "audio_file"
+        # Pass the spooled upload on by file handle instead of reading it into memory
+        audio_file = file.file
 
         # Handle image if provided
-        image_data = None
-        print(f"[IMAGE] ========== STARTING IMAGE PROCESSING ==========")
-        print(f"[IMAGE] image parameter received: {image is not None}")
-        print(f"[IMAGE] image object type: {type(image)}")
-        if image:
-            print(f"[IMAGE] image.filename: {image.filename}")
-            print(f"[IMAGE] image.content_type: {image.content_type if hasattr(image, 'content_type') else 'N/A'}")
-            print(f"[IMAGE] image.size: {image.size if hasattr(image, 'size') else 'N/A'}")
-        else:
-            print(f"[IMAGE] NO IMAGE OBJECT - image parameter is None")
-        
-        if image and image.filename:
-            print(f"[IMAGE] Image condition met - proceeding with processing")
-            print(f"[IMAGE] Processing image: {image.filename}")
-            print(f"[IMAGE] Image object type: {type(image)}")
-            print(f"[IMAGE] Image has read method: {hasattr(image, 'read')}")
-            try:
-                # Reset file pointer to beginning (in case it was already read)
-                if hasattr(image.file, 'seek'):
-                    image.file.seek(0)
-                
-                image_content = await image.read()
-                print(f"[IMAGE] Image content size: {len(image_content)} bytes")
-                print(f"[IMAGE] Image content type: {type(image_content)}")
-                
-                if len(image_content) > 0:
-                    # Generate unique filename with timestamp
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    file_extension = Path(image.filename).suffix
-                    unique_filename = f"{timestamp}_{Path(image.filename).stem}{file_extension}"
-                    
-                    # Save image to local directory
-                    image_path = IMAGES_DIR / unique_filename
-                    print(f"[IMAGE] Saving to: {image_path}")
-                    print(f"[IMAGE] Directory exists: {IMAGES_DIR.exists()}")
-                    print(f"[IMAGE] Directory path: {IMAGES_DIR}")
-                    
-                    # Generate image URL for database BEFORE saving (separate from agent)
-                    image_url = f"/images/{unique_filename}"
-                    print(f"[IMAGE] Image URL generated: {image_url}")
-                    
-                    # Save image to local directory
-                    image_saved = False
-                    try:
-                        print(f"[IMAGE] Attempting to write {len(image_content)} bytes to: {image_path}")
-                        print(f"[IMAGE] Parent directory exists: {image_path.parent.exists()}")
-                        print(f"[IMAGE] Parent directory: {image_path.parent}")
-                        print(f"[IMAGE] Parent is writable: {os.access(image_path.parent, os.W_OK) if image_path.parent.exists() else 'N/A'}")
-                        
-                        # Ensure parent directory exists
-                        image_path.parent.mkdir(parents=True, exist_ok=True)
-                        
-                        # Write file
-                        with open(image_path, "wb") as f:
-                            bytes_written = f.write(image_content)
-                            f.flush()
-                            os.fsync(f.fileno())  # Force write to disk
-                        
-                        print(f"[IMAGE] Bytes written to file: {bytes_written}")
-                        
-                        # Verify file was saved
-                        image_saved = image_path.exists()
-                        if image_saved:
-                            file_size = image_path.stat().st_size
-                            print(f"[IMAGE] ✓ Image saved successfully!")
-                            print(f"[IMAGE] ✓ File path: {image_path}")
-                            print(f"[IMAGE] ✓ File size on disk: {file_size} bytes")
-                            print(f"[IMAGE] ✓ File exists: {image_saved}")
-                        else:
-                            print(f"[IMAGE] ✗ WARNING: Image save reported success but file not found!")
-                            print(f"[IMAGE] ✗ Expected path: {image_path}")
-                            print(f"[IMAGE] ✗ Directory contents: {list(image_path.parent.iterdir()) if image_path.parent.exists() else 'Directory does not exist'}")
-                    except PermissionError as pe:
-                        print(f"[IMAGE] ✗ PERMISSION ERROR saving image: {pe}")
-                        print(f"[IMAGE] ✗ Path: {image_path}")
-                        print(f"[IMAGE] ✗ Check write permissions for: {image_path.parent}")
-                    except Exception as e:
-                        print(f"[IMAGE] ✗ ERROR saving image: {e}")
-                        print(f"[IMAGE] ✗ Exception type: {type(e).__name__}")
-                        import traceback
-                        print(f"[IMAGE] ✗ Traceback:\n{traceback.format_exc()}")
-                    
-                    # Always create image_data with image_url, even if save failed
-                    image_data = {
-                        "filename": image.filename,
-                        "unique_filename": unique_filename,
-                        "file_path": str(image_path),
-                        "content_type": image.content_type,
-                        "size": len(image_content),
-                        "image_url": image_url,  # Always use the generated URL
-                        "image_saved": image_saved  # Flag to indicate if file was actually saved
-                    }
-                    print(f"[IMAGE] ========== IMAGE DATA CREATED ==========")
-                    print(f"[IMAGE] image_data['image_url']: {image_data.get('image_url')}")
-                    print(f"[IMAGE] image_data['unique_filename']: {image_data.get('unique_filename')}")
-                    print(f"[IMAGE] image_data['filename']: {image_data.get('filename')}")
-                    print(f"[IMAGE] image_data['file_path']: {image_data.get('file_path')}")
-                    print(f"[IMAGE] image_saved flag: {image_data.get('image_saved')}")
-                else:
-                    print(f"[IMAGE] Image content is empty - skipping")
-            except Exception as e:
-                print(f"[IMAGE] ========== ERROR READING IMAGE ==========")
-                print(f"[IMAGE] Error type: {type(e).__name__}")
-                print(f"[IMAGE] Error message: {str(e)}")
-                import traceback
-                print(f"[IMAGE] Full traceback:\n{traceback.format_exc()}")
-        else:
-            print(f"[IMAGE] ========== SKIPPING IMAGE PROCESSING ==========")
-            print(f"[IMAGE] Reason: image={image}, filename={image.filename if image else 'None'}")
-        
-        # Verify image_data before passing to agent
-        if image_data:
-            print(f"[APP] Image data before agent: image_url={image_data.get('image_url')}, unique_filename={image_data.get('unique_filename')}")
-        else:
-            print(f"[APP] No image_data to pass to agent")
+        image_data = await _save_image_upload(image)
         
         # Import and use the LangChain agent
-        print("[AGENT] Starting LangChain agent processing...")
-        from agent import process_audio_with_agent
+        from agent import process_recording
         
-        # Process audio using the AI agent with Unicode error handling
-        try:
-            result = process_audio_with_agent(audio_bytes, file.filename or "audio_file", image_data)
-        except UnicodeEncodeError as unicode_error:
-            print(f"[ERROR] Unicode encoding error: {unicode_error}")
-            # Fallback: Try to save basic data even if agent fails due to Unicode
-            try:
-                from db import save_feedback
-                fallback_data = {
-                    "purchased": None,
-                    "salesperson_name": None,
-                    "item_type": None,
-                    "metal_type": None,
-                    "reason_price": None,
-                    "reason_size": None,
-                    "reason_weight": None,
-                    "reason_zeromaking": None,
-                    "reason_design_outofstock": None,
-                    "reason_design_new": None,
-                    "required_size": None,
-                    "required_weight": None,
-                    "available_size": None,
-                    "available_weight": None,
-                    "asked_price": None,
-                    "given_price": None,
-                    "design_type": None,
-                    "item_category": None,
-                    "customer_intent": None,
-                    "is_previous_cust": None,
-                    "type_of_customer": None,
-                    "M_Source": None,
-                    "M_source_Tag": None,
-                    "design_preference": None,
-                    "store_impression": None,
-                    "customer_mood": None,
-                    "customer_support": None,
-                    "purchase_satisfaction": None,
-                    "waiting_time": None,
-                    "original_text": f"Unicode encoding error: {unicode_error}",
-                    "contact_number": None,
-                    "image_url": image_data.get('image_url') if image_data else None
-                }
-                save_result = save_feedback(fallback_data)
-                print(f"Fallback save result: {save_result}")
-                return {
-                    "message": "Unicode encoding error occurred, but basic data saved",
-                    "error": str(unicode_error),
-                    "status": "partial_success",
-                    "fallback_saved": True
-                }
-            except Exception as fallback_error:
-                print(f"Fallback save also failed: {fallback_error}")
-                raise HTTPException(status_code=500, detail=f"Unicode encoding error: {unicode_error}")
+        # Process audio using the AI agent, saving basic data if it fails.
+        # Runs on the pipeline threads so concurrent uploads are processed in parallel
+        # without blocking the event loop; each call keeps its audio and image in its
+        # own request context.
+        result = await run_in_pipeline_executor(
+            process_recording, audio_file, file.filename or "audio_file", image_data, mode=mode
+        )
         
-        print(f"Agent result: {result}")
+        logger.info("process_audio finished: %s", result["status"])
+        logger.debug("Pipeline result: %s", result)
         
         if result["status"] == "error":
-            print(f"Agent processing failed: {result['error']}")
-            # Fallback: Try to save basic data even if agent fails
-            try:
-                from db import save_feedback
-                fallback_data = {
-                    "purchased": None,
-                    "salesperson_name": None,
-                    "item_type": None,
-                    "metal_type": None,
-                    "reason_price": None,
-                    "reason_size": None,
-                    "reason_weight": None,
-                    "reason_zeromaking": None,
-                    "reason_design_outofstock": None,
-                    "reason_design_new": None,
-                    "required_size": None,
-                    "required_weight": None,
-                    "available_size": None,
-                    "available_weight": None,
-                    "asked_price": None,
-                    "given_price": None,
-                    "design_type": None,
-                    "item_category": None,
-                    "customer_intent": None,
-                    "is_previous_cust": None,
-                    "type_of_customer": None,
-                    "M_Source": None,
-                    "M_source_Tag": None,
-                    "design_preference": None,
-                    "store_impression": None,
-                    "customer_mood": None,
-                    "customer_support": None,
-                    "purchase_satisfaction": None,
-                    "waiting_time": None,
-                    "original_text": f"Audio processing failed: {result['error']}",
-                    "contact_number": None,
-                    "image_url": image_data.get('image_url') if image_data else None
-                }
-                save_result = save_feedback(fallback_data)
-                print(f"Fallback save result: {save_result}")
-                return {
-                    "message": "Audio processing failed, but basic data saved",
-                    "error": result["error"],
-                    "status": "partial_success",
-                    "fallback_saved": True
-                }
-            except Exception as fallback_error:
-                print(f"Fallback save also failed: {fallback_error}")
-                raise HTTPException(status_code=500, detail=f"Processing failed: {result['error']}")
-        
-        print("Agent processing completed successfully")
+            raise HTTPException(status_code=500, detail=f"Processing failed: {result['error']}")
+        if result["status"] == "partial_success":
+            return result
         
         # Return debug info about image
         response_data = {
@@ -375,11 +356,12 @@ async def process_audio(file: UploadFile = File(...), image: UploadFile = File(N
         if image_data:
             response_data["image_debug"] = {
                 "image_url": image_data.get("image_url"),
+                "thumbnail_url": image_data.get("thumbnail_url"),
+                "preview_url": image_data.get("preview_url"),
                 "unique_filename": image_data.get("unique_filename"),
                 "filename": image_data.get("filename"),
                 "image_saved": image_data.get("image_saved")
             }
-            print(f"[RESPONSE] Returning image debug info: {response_data['image_debug']}")
         
         return response_data
         
@@ -388,6 +370,123 @@ async def process_audio(file: UploadFile = File(...), image: UploadFile = File(N
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), image: UploadFile = File(None), mode: str = Form(None)):
+    """
+    Queue salesperson audio for background processing.
+    Saves the upload and returns a job id right away; poll GET /jobs/{job_id} for the result.
+    """
+    _check_audio_upload(file)
+    mode = _check_mode(mode)
+    
+    image_data = await _save_image_upload(image)
+    job_id = await run_in_threadpool(job_queue.submit, file.file, file.filename or "audio_file", image_data, mode=mode)
+    logger.info("Queued job %s for %s", job_id, file.filename)
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status and, once finished, the result of a background job."""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Batches currently being processed, so the same batch is never run twice at once
+_running_batches = set()
+_running_batches_lock = threading.Lock()
+
+def _batch_folder(batch_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch.BATCH_DIR / batch_id
+
+def _run_batch_in_background(batch_id, concurrency, mode):
+    def run():
+        try:
+            batch.run_batch(batch.BATCH_DIR / batch_id, IMAGES_DIR, concurrency=concurrency, mode=mode)
+        except Exception as e:
+            logger.exception("Batch %s failed", batch_id)
+        finally:
+            with _running_batches_lock:
+                _running_batches.discard(batch_id)
+    threading.Thread(target=run, name=f"batch-{batch_id}", daemon=True).start()
+
+def _write_batch_files(folder, files, create):
+    """Copy uploaded files into a batch folder and return how many recordings it holds. Blocking; run in a worker thread."""
+    if create:
+        folder.mkdir(parents=True)
+    for upload in files:
+        if not upload.filename:
+            continue
+        if _upload_size(upload) > MAX_AUDIO_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"{upload.filename} is too large (limit {MAX_AUDIO_UPLOAD_BYTES} bytes)")
+        with open(folder / Path(upload.filename).name, "wb") as f:
+            shutil.copyfileobj(upload.file, f, UPLOAD_CHUNK_BYTES)
+    return len(batch.find_recordings(folder))
+
+@app.post("/process_batch", status_code=202)
+async def process_batch(
+    files: List[UploadFile] = File(None),
+    batch_id: str = Form(None),
+    concurrency: int = Form(batch.BATCH_CONCURRENCY, ge=1, le=batch.BATCH_MAX_CONCURRENCY),
+    mode: str = Form(None),
+):
+    """
+    Process a folder's worth of recordings in the background.
+    Upload audio files and optional images (paired by file name) to start a new batch,
+    or send only `batch_id` to resume one; recordings already done are skipped.
+    Poll GET /process_batch/{batch_id} for progress.
+    """
+    mode = _check_mode(mode)
+    new_batch = not batch_id
+    if batch_id:
+        folder = _batch_folder(batch_id)
+        if not await run_in_threadpool(folder.is_dir):
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if batch_id in _running_batches:
+            raise HTTPException(status_code=409, detail="Batch is already running")
+    else:
+        if not files:
+            raise HTTPException(status_code=400, detail="Upload at least one recording or pass a batch_id")
+        batch_id = uuid.uuid4().hex
+        folder = batch.BATCH_DIR / batch_id
+    
+    try:
+        recordings = await run_in_threadpool(_write_batch_files, folder, files or [], new_batch)
+        if not recordings:
+            raise HTTPException(status_code=400, detail="No audio recordings in batch")
+    except Exception:
+        if new_batch:
+            # The id of a batch that failed to start is never returned, so nothing could resume it
+            await run_in_threadpool(shutil.rmtree, folder, True)
+        raise
+    
+    with _running_batches_lock:
+        if batch_id in _running_batches:
+            raise HTTPException(status_code=409, detail="Batch is already running")
+        _running_batches.add(batch_id)
+    _run_batch_in_background(batch_id, concurrency, mode)
+    logger.info("Started batch %s with %d recording(s)", batch_id, recordings)
+    return {"batch_id": batch_id, "recordings": recordings, "status": "running", "status_url": f"/process_batch/{batch_id}"}
+
+@app.get("/process_batch/{batch_id}")
+async def get_batch(batch_id: str):
+    """Get the progress of a batch from its manifest."""
+    folder = _batch_folder(batch_id)
+    if not folder.is_dir():
+        raise HTTPException(status_code=404, detail="Batch not found")
+    summary = await run_in_threadpool(lambda: batch.Manifest(folder / batch.MANIFEST_NAME).summary())
+    summary["batch_id"] = batch_id
+    summary["running"] = batch_id in _running_batches
+    return summary
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline stage timings, fallback counters and in-flight gauges in Prometheus text format."""
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -397,8 +496,7 @@ async def health_check():
         "agent": "LangChain Agent Active"
     }
 
-@app.get("/api/feedback")
-async def get_feedback(
+def _feedback_filters(
     feedbackId: str = None,
     salesperson: str = None,
     itemType: str = None,
@@ -409,149 +507,234 @@ async def get_feedback(
     storeImpression: str = None,
     customerSupport: str = None,
     priceIssue: str = None,
-    sizeIssue: str = None
+    sizeIssue: str = None,
+    purchased: str = None,
+    typeOfCustomer: str = None,
+    mSource: str = None,
+    designType: str = None,
+    weightIssue: str = None,
+    zeroMaking: str = None,
+    designOutOfStock: str = None,
+    designNew: str = None
 ):
-    """Get filtered feedback data for the filter table."""
+    """
+    Dashboard filter query parameters shared by the feedback endpoints.
+    The ones after sizeIssue are only applied by /api/feedback/stats (see STATS_FILTER_FIELDS).
+    """
+    return {
+        "feedbackId": feedbackId,
+        "salesperson": salesperson,
+        "itemType": itemType,
+        "metalType": metalType,
+        "customerIntent": customerIntent,
+        "designPreference": designPreference,
+        "customerMood": customerMood,
+        "storeImpression": storeImpression,
+        "customerSupport": customerSupport,
+        "priceIssue": priceIssue,
+        "sizeIssue": sizeIssue,
+        "purchased": purchased,
+        "typeOfCustomer": typeOfCustomer,
+        "mSource": mSource,
+        "designType": designType,
+        "weightIssue": weightIssue,
+        "zeroMaking": zeroMaking,
+        "designOutOfStock": designOutOfStock,
+        "designNew": designNew
+    }
+
+@app.get("/api/feedback")
+async def get_feedback(
+    filters: dict = Depends(_feedback_filters),
+    limit: int = Query(None, ge=1, le=1000),
+    after: str = None,
+    sort: str = "-created_at",
+    fields: str = None
+):
+    """
+    Get filtered feedback data for the filter table.
+    Without `limit` the response is a JSON array of all matching records.
+    With `limit` it is {"items": [...], "next_cursor": ...}; pass next_cursor
+    back as `after` to get the next page. `fields` is a comma-separated list
+    of fields to return, and `sort` is "-created_at" (default) or "created_at".
+    Records are streamed from the database cursor as they are read.
+    """
     try:
-        from db import get_filtered_feedback
+        from db import iter_filtered_feedback, decode_cursor, SORT_ORDERS
         
-        filters = {
-            "feedbackId": feedbackId,
-            "salesperson": salesperson,
-            "itemType": itemType,
-            "metalType": metalType,
-            "customerIntent": customerIntent,
-            "designPreference": designPreference,
-            "customerMood": customerMood,
-            "storeImpression": storeImpression,
-            "customerSupport": customerSupport,
-            "priceIssue": priceIssue,
-            "sizeIssue": sizeIssue
-        }
+        if sort not in SORT_ORDERS:
+            raise HTTPException(status_code=400, detail=f"Unsupported sort: {sort}")
+        if after:
+            try:
+                decode_cursor(after)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
         
-        feedback_data = get_filtered_feedback(filters)
-        return feedback_data
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        records = iter_filtered_feedback(filters, limit=limit, after=after, sort=sort, fields=field_list)
+        return StreamingResponse(_stream_feedback(records, limit), media_type="application/json")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching filtered feedback: {str(e)}")
 
+def _stream_feedback(records, limit):
+    """
+    Serialize records as a JSON array, or a page object when paginating.
+    Records are sent in chunks of FEEDBACK_READ_BATCH_SIZE: StreamingResponse
+    runs each step of this generator as its own threadpool call.
+    """
+    from db import encode_cursor, FEEDBACK_READ_BATCH_SIZE
+    
+    chunk = ['{"items": [' if limit else '[']
+    last, count = None, 0
+    try:
+        for record in records:
+            if record.get("image_url"):
+                # Table views load the thumbnail and open the preview, not the full-size photo
+                record.update(variant_urls(record["image_url"]))
+            chunk.append(("," if count else "") + json.dumps(jsonable_encoder(record)))
+            last, count = record, count + 1
+            if len(chunk) >= FEEDBACK_READ_BATCH_SIZE:
+                yield "".join(chunk)
+                chunk = []
+    except Exception as e:
+        # Headers may already be sent; end the document so the client still gets valid JSON
+        logger.error("Error streaming feedback data: %s", e)
+    if limit:
+        next_cursor = encode_cursor(last) if count == limit else None
+        chunk.append(f'], "next_cursor": {json.dumps(next_cursor)}}}')
+    else:
+        chunk.append(']')
+    yield "".join(chunk)
+
+@app.get("/api/feedback/stats")
+async def get_feedback_stats(filters: dict = Depends(_feedback_filters)):
+    """
+    Counts for the dashboard stat cards, computed in the database.
+    Accepts the same filters as /api/feedback.
+    """
+    try:
+        from db import get_feedback_stats as db_get_feedback_stats
+        return await run_in_threadpool(db_get_feedback_stats, filters)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching feedback stats: {str(e)}")
+
 @app.get("/test-images")
-async def test_images():
-    """Test endpoint to check images directory."""
+async def test_images(limit: int = Query(100, ge=1, le=10000)):
+    """Test endpoint to check the images directory; lists up to `limit` stored files."""
     try:
-        files = list(IMAGES_DIR.iterdir())
+        files = await run_in_threadpool(lambda: list(itertools.islice(image_store.iter_names(), limit)))
         return {
             "directory": str(IMAGES_DIR),
             "exists": IMAGES_DIR.exists(),
-            "files": [f.name for f in files]
+            "files": files,
+            "truncated": len(files) == limit,
         }
     except Exception as e:
         return {"error": str(e)}
 
-@app.get("/images/{filename}")
-async def serve_image(filename: str):
-    """Serve images from local directory."""
+# Cache-Control per kind of image file (see ImageStore.lookup). Content-addressed
+# files never change, so browsers keep them without revalidating; a variant that
+# is not generated yet must not be cached as the full-size original.
+IMAGE_CACHE_CONTROL = {
+    "original": "public, max-age=31536000, immutable",
+    "variant": "public, max-age=31536000, immutable",
+    "fallback": "no-cache",
+    "legacy": "no-cache",
+}
+
+def _image_etag(path, kind, stat_result):
+    """Strong ETag: the content hash for originals, otherwise the file's name, size and modification time."""
+    if kind == "original":
+        return f'"{path.name.split(".", 1)[0]}"'
+    return f'"{path.name}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def _etag_matches(if_none_match, etag):
+    """If-None-Match uses the weak comparison, so W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+@app.api_route("/images/{filename}", methods=["GET", "HEAD"])
+async def serve_image(filename: str, request: Request):
+    """
+    Serve an image, thumbnail or preview with a strong ETag (304 for a matching
+    If-None-Match), long-lived caching for content-addressed files and byte-range
+    support. Thumbnails and previews are served as WebP to browsers that accept it.
+    """
     try:
-        print(f"[IMAGE_SERVE] Requested filename: {filename}")
-        image_path = IMAGES_DIR / filename
-        print(f"[IMAGE_SERVE] Full path: {image_path}")
-        print(f"[IMAGE_SERVE] Path exists: {image_path.exists()}")
-        print(f"[IMAGE_SERVE] Directory contents: {list(IMAGES_DIR.iterdir())}")
-        
-        if image_path.exists():
-            print(f"[IMAGE_SERVE] Serving file: {image_path}")
-            return FileResponse(image_path)
-        else:
-            print(f"[IMAGE_SERVE] File not found: {image_path}")
+        accept_webp = "image/webp" in request.headers.get("accept", "")
+        image_path, kind = await run_in_threadpool(image_store.lookup, filename, accept_webp)
+        if image_path is None:
+            logger.info("Image not found: %s", filename)
             raise HTTPException(status_code=404, detail="Image not found")
+        
+        stat_result = await run_in_threadpool(image_path.stat)
+        headers = {
+            "ETag": _image_etag(image_path, kind, stat_result),
+            "Cache-Control": IMAGE_CACHE_CONTROL[kind],
+        }
+        if kind in ("variant", "fallback"):
+            # The same URL returns WebP or JPEG depending on the Accept header
+            headers["Vary"] = "Accept"
+        
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        
+        logger.debug("Serving image %s (%s)", image_path, kind)
+        # FileResponse answers Range and If-Range requests (206) using the ETag above
+        return FileResponse(image_path, headers=headers, stat_result=stat_result)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[IMAGE_SERVE] Error: {e}")
+        logger.error("Error serving image %s: %s", filename, e)
         raise HTTPException(status_code=500, detail=f"Error serving image: {str(e)}")
 
 @app.delete("/api/feedback/{feedback_id}")
 async def delete_feedback(feedback_id: str):
     """Delete a specific feedback record and associated image file."""
-    print(f"[DELETE_API] ========== DELETE REQUEST ==========")
-    print(f"[DELETE_API] Feedback ID: {feedback_id}")
+    logger.info("Delete requested for feedback %s", feedback_id)
     try:
         from db import delete_feedback_record
-        result = delete_feedback_record(feedback_id)
-        print(f"[DELETE_API] Result from delete_feedback_record: {result}")
-        print(f"[DELETE_API] Result type: {type(result)}")
+        result = await run_in_threadpool(delete_feedback_record, feedback_id)
         
         if not result:
-            print(f"[DELETE_API] ✗ Record not found or deletion failed")
             raise HTTPException(status_code=404, detail="Feedback not found")
         
         # Check if result is a dict with image_url (new format)
         if isinstance(result, dict) and result.get("deleted"):
             image_url = result.get("image_url")
-            print(f"[DELETE_API] Image URL from database: {image_url}")
-            print(f"[DELETE_API] Image URL type: {type(image_url)}")
-            print(f"[DELETE_API] Image URL truthy check: {bool(image_url)}")
             
             # Delete associated image file if it exists
             if image_url and image_url != "null" and str(image_url).strip():
                 try:
-                    # Extract filename from image_url (e.g., /images/20251029_123456_filename.jpg)
-                    # Remove leading /images/ if present, handle both /images/ and images/ prefixes
+                    # The record's image_url (/images/<name>) maps to exactly one path in the store
                     filename = str(image_url).strip()
-                    if filename.startswith("/images/"):
-                        filename = filename.replace("/images/", "", 1)
-                    elif filename.startswith("images/"):
-                        filename = filename.replace("images/", "", 1)
-                    
-                    image_path = IMAGES_DIR / filename
-                    print(f"[DELETE_API] Extracted filename: {filename}")
-                    print(f"[DELETE_API] Full image path: {image_path}")
-                    print(f"[DELETE_API] Path exists: {image_path.exists()}")
-                    print(f"[DELETE_API] Images directory: {IMAGES_DIR}")
-                    print(f"[DELETE_API] Images directory exists: {IMAGES_DIR.exists()}")
+                    filename = filename.removeprefix("/").removeprefix("images/")
                     
-                    if image_path.exists() and image_path.is_file():
-                        try:
-                            image_path.unlink()
-                            # Verify deletion succeeded
-                            if image_path.exists():
-                                print(f"[DELETE_API] ✗ WARNING: File still exists after deletion attempt. File may be locked by another process (File Explorer, image viewer, etc.)")
-                            else:
-                                print(f"[DELETE_API] ✓ Successfully deleted image file: {image_path}")
-                        except PermissionError as pe:
-                            print(f"[DELETE_API] ✗ Permission denied - File may be open in File Explorer or another program: {pe}")
-                        except Exception as delete_error:
-                            print(f"[DELETE_API] ✗ Error deleting file: {delete_error}")
+                    if result.get("image_in_use"):
+                        # Content-addressed images are shared by every record with the same photo
+                        logger.info("Image %s is used by other records, keeping it", filename)
+                    elif await run_in_threadpool(image_store.delete, filename):
+                        logger.info("Deleted image %s and its variants", filename)
                     else:
-                        print(f"[DELETE_API] ✗ Image file not found: {image_path}")
-                        # Try to list files in directory for debugging
-                        try:
-                            files_in_dir = list(IMAGES_DIR.glob("*"))
-                            print(f"[DELETE_API] Files in images directory: {[f.name for f in files_in_dir[:10]]}")
-                            # Check if filename matches any file (case-insensitive)
-                            matching_files = [f for f in files_in_dir if f.name.lower() == filename.lower()]
-                            if matching_files:
-                                print(f"[DELETE_API] Found case-insensitive match: {matching_files[0]}")
-                                matching_files[0].unlink()
-                                print(f"[DELETE_API] ✓ Deleted case-insensitive match: {matching_files[0]}")
-                        except Exception as list_error:
-                            print(f"[DELETE_API] Could not list directory: {list_error}")
-                except Exception as image_error:
-                    print(f"[DELETE_API] ✗ Error deleting image file: {image_error}")
-                    import traceback
-                    print(f"[DELETE_API] Traceback: {traceback.format_exc()}")
+                        logger.info("Image file not found: %s", filename)
+                except PermissionError as pe:
+                    logger.warning("Permission denied deleting image %s, it may be open in another program: %s", image_url, pe)
+                except Exception:
+                    logger.exception("Error deleting image file for feedback %s", feedback_id)
                     # Don't fail the deletion if image deletion fails
-            else:
-                print(f"[DELETE_API] No image_url found in record (image_url={image_url}), skipping image deletion")
         else:
-            print(f"[DELETE_API] Result is not expected dict format: {result}")
+            logger.warning("Unexpected result from delete_feedback_record: %s", result)
         
-        print(f"[DELETE_API] ========== DELETE COMPLETE ==========")
         return {"message": "Feedback deleted successfully"}
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[DELETE_API] ✗ Exception: {e}")
-        import traceback
-        print(f"[DELETE_API] Traceback: {traceback.format_exc()}")
+        logger.exception("Error deleting feedback %s", feedback_id)
         raise HTTPException(status_code=500, detail=f"Error deleting feedback: {str(e)}")
 
 @app.get("/dashboard")
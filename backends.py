@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+from cache import content_hash
+from logging_config import get_logger
+from schema import FIELDS
+
+load_dotenv()
+
+logger = get_logger("backends")
+
+# Backend selection: "openai" (default) or "fake", an offline stand-in for load tests and benchmarks.
+# TRANSCRIPTION_BACKEND and EXTRACTION_BACKEND override CRM_BACKEND for one stage.
+CRM_BACKEND = os.getenv("CRM_BACKEND", "openai").strip().lower()
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", CRM_BACKEND).strip().lower()
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", CRM_BACKEND).strip().lower()
+
+# Simulated latency of the fake backends, plus up to FAKE_LATENCY_JITTER_MS of random extra delay
+FAKE_TRANSCRIBE_LATENCY_MS = float(os.getenv("FAKE_TRANSCRIBE_LATENCY_MS", "0"))
+FAKE_EXTRACT_LATENCY_MS = float(os.getenv("FAKE_EXTRACT_LATENCY_MS", "0"))
+FAKE_LATENCY_JITTER_MS = float(os.getenv("FAKE_LATENCY_JITTER_MS", "0"))
+
+EXTRACTION_MODEL = "gpt-4o-mini"
+TRANSCRIPTION_MODEL = "whisper-1"
+
+def _openai_client():
+    from openai import OpenAI
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY missing in environment")
+    return OpenAI(api_key=api_key)
+
+class OpenAITranscriber:
+    """Transcription with OpenAI Whisper."""
+
+    name = "openai"
+
+    def __init__(self):
+        self.client = _openai_client()
+
+    def transcribe(self, file_obj, filename):
+        # Whisper detects the format from the file name, so pass it explicitly
+        transcript = self.client.audio.transcriptions.create(
+            model=TRANSCRIPTION_MODEL,
+            file=(filename, file_obj)
+        )
+        return transcript.text
+
+class OpenAIExtractor:
+    """Extraction with a gpt-4o-mini chat completion; returns the raw model text."""
+
+    name = "openai"
+
+    def __init__(self):
+        self.client = _openai_client()
+
+    def complete(self, prompt):
+        response = self.client.chat.completions.create(
+            model=EXTRACTION_MODEL,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return response.choices[0].message.content
+
+def _simulate_latency(latency_ms):
+    delay_ms = latency_ms + (random.uniform(0, FAKE_LATENCY_JITTER_MS) if FAKE_LATENCY_JITTER_MS else 0)
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000)
+
+class FakeTranscriber:
+    """
+    Offline stand-in for Whisper. Sleeps for the configured latency and returns a
+    transcript that depends only on the audio bytes, so repeated runs are identical.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms=FAKE_TRANSCRIBE_LATENCY_MS):
+        self.latency_ms = latency_ms
+
+    def transcribe(self, file_obj, filename):
+        digest = content_hash(file_obj)
+        _simulate_latency(self.latency_ms)
+        return (
+            f"Recording {digest[:12]}. The customer looked at gold chains around 20 grams "
+            f"but did not buy because the price was higher than expected and the design was out of stock."
+        )
+
+class FakeExtractor:
+    """
+    Offline stand-in for the extraction model. Returns a complete CRM record as JSON,
+    with schema-valid values picked deterministically from a hash of the prompt.
+    """
+
+    name = "fake"
+
+    SALESPERSONS = ["Arun", "Priya", "Karthik", "Divya"]
+
+    def __init__(self, latency_ms=FAKE_EXTRACT_LATENCY_MS):
+        self.latency_ms = latency_ms
+
+    def complete(self, prompt):
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        _simulate_latency(self.latency_ms)
+        rng = random.Random(seed)
+        record = {}
+        for field in FIELDS:
+            if field.kind == "enum":
+                record[field.name] = rng.choice(field.values)
+            elif field.kind == "number":
+                record[field.name] = rng.choice([None, rng.randint(2, 60)])
+            else:
+                record[field.name] = None
+        record["salesperson_name"] = rng.choice(self.SALESPERSONS)
+        # The transcript is the last part of the prompt
+        record["original_text"] = prompt.rpartition('Analyze this text:\n"')[2][:-1]
+        return json.dumps(record)
+
+TRANSCRIBERS = {"openai": OpenAITranscriber, "fake": FakeTranscriber}
+EXTRACTORS = {"openai": OpenAIExtractor, "fake": FakeExtractor}
+
+_transcriber = None
+_extractor = None
+_backend_lock = threading.Lock()
+
+def _create(registry, backend, stage):
+    if backend not in registry:
+        raise ValueError(f"Unknown {stage} backend '{backend}', expected one of: {', '.join(registry)}")
+    logger.info("Using '%s' %s backend", backend, stage)
+    return registry[backend]()
+
+def get_transcriber():
+    """Return the configured transcription backend, created on first use."""
+    global _transcriber
+    with _backend_lock:
+        if _transcriber is None:
+            _transcriber = _create(TRANSCRIBERS, TRANSCRIPTION_BACKEND, "transcription")
+    return _transcriber
+
+def get_extractor():
+    """Return the configured extraction backend, created on first use."""
+    global _extractor
+    with _backend_lock:
+        if _extractor is None:
+            _extractor = _create(EXTRACTORS, EXTRACTION_BACKEND, "extraction")
+    return _extractor
+
+def set_backends(transcriber=None, extractor=None):
+    """Replace the backends in use, e.g. with a fake or instrumented one."""
+    global _transcriber, _extractor
+    with _backend_lock:
+        if transcriber is not None:
+            _transcriber = transcriber
+        if extractor is not None:
+            _extractor = extractor
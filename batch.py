@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Batch ingestion of a folder of recordings.
+
+Audio files are paired with an optional image that has the same name
+(e.g. visit_12.webm + visit_12.jpg), run through the same pipeline as
+/process_audio with a bounded number of workers, and the outcome of each
+file is written to a manifest in the folder. Running the batch again skips
+recordings the manifest already lists as done, so an interrupted or
+partly failed batch can simply be re-run.
+
+Usage: python batch.py FOLDER [--concurrency 4] [--mode direct] [--manifest PATH] [--images-dir DIR]
+"""
+
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+from logging_config import get_logger, set_request_id, reset_request_id
+
+load_dotenv()
+
+logger = get_logger("batch")
+
+# Batch configuration
+BATCH_DIR = Path(os.getenv("BATCH_DIR", "batch_data")).resolve()
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Each worker calls Whisper and the LLM, so a batch never runs more than this many at once
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+MANIFEST_NAME = "manifest.json"
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac", ".aac", ".amr", ".mp4"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+IMAGE_CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".gif": "image/gif", ".webp": "image/webp", ".bmp": "image/bmp"}
+
+# Results that saved a record; these are skipped when the batch is run again
+DONE_STATUSES = {"success", "partial_success"}
+
+def find_recordings(folder):
+    """Return (audio_path, image_path or None) pairs for a folder, in name order."""
+    folder = Path(folder)
+    files = sorted(path for path in folder.rglob("*") if path.is_file())
+    images = {path.with_suffix(""): path for path in files if path.suffix.lower() in IMAGE_EXTENSIONS}
+    return [(path, images.get(path.with_suffix(""))) for path in files if path.suffix.lower() in AUDIO_EXTENSIONS]
+
+class Manifest:
+    """
+    Per-recording progress of a batch, stored as JSON next to the recordings.
+    Entries are keyed by the audio path relative to the folder and rewritten
+    atomically after every recording, so progress survives a crash.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("recordings", {})
+
+    def is_done(self, key, audio_path):
+        """Done means a record was saved for this exact file (same size and modification time)."""
+        entry = self.entries.get(key)
+        if not entry or entry.get("status") not in DONE_STATUSES:
+            return False
+        stat = audio_path.stat()
+        return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+
+    def update(self, key, **fields):
+        with self._lock:
+            self.entries.setdefault(key, {}).update(fields)
+            self._write()
+
+    def _write(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"updated_at": datetime.now().isoformat(), "recordings": self.entries}, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        with self._lock:
+            counts = {}
+            for entry in self.entries.values():
+                counts[entry.get("status")] = counts.get(entry.get("status"), 0) + 1
+            return {"total": len(self.entries), "counts": counts, "recordings": dict(self.entries)}
+
+def store_image(image_path, image_store):
+    """Store a batch image in the image store and return the image_data used by the pipeline."""
+    return image_store.save_path(image_path, IMAGE_CONTENT_TYPES.get(image_path.suffix.lower(), "application/octet-stream"))
+
+def run_batch(folder, images_dir, manifest_path=None, concurrency=BATCH_CONCURRENCY, mode=None):
+    """
+    Process every recording in `folder` that the manifest does not list as done.
+    Returns the manifest summary.
+    """
+    from agent import process_recording
+    from db import deferred_inserts, flush_inserts
+    from images import ImageStore
+
+    if not 1 <= concurrency <= BATCH_MAX_CONCURRENCY:
+        logger.warning("Concurrency %d is out of range, using %d", concurrency, min(max(1, concurrency), BATCH_MAX_CONCURRENCY))
+        concurrency = min(max(1, concurrency), BATCH_MAX_CONCURRENCY)
+    folder = Path(folder)
+    manifest = Manifest(manifest_path or folder / MANIFEST_NAME)
+    image_store = ImageStore(images_dir)
+    pending = []
+    for audio_path, image_path in find_recordings(folder):
+        key = audio_path.relative_to(folder).as_posix()
+        if manifest.is_done(key, audio_path):
+            continue
+        pending.append((key, audio_path, image_path))
+    logger.info("%s: %d recording(s) to process, concurrency %d", folder, len(pending), concurrency)
+
+    def process(item):
+        key, audio_path, image_path = item
+        # Log lines of this recording carry its manifest key
+        token = set_request_id(key)
+        stat = audio_path.stat()
+        manifest.update(key, status="running", size=stat.st_size, mtime=stat.st_mtime, started_at=datetime.now().isoformat())
+        try:
+            # Reuse the image stored by an earlier attempt instead of copying it again
+            image_data = manifest.entries[key].get("image_data")
+            if image_path and not image_data:
+                image_data = store_image(image_path, image_store)
+                manifest.update(key, image_data=image_data)
+            # With MONGO_WRITE_BEHIND the record is queued for a batched insert instead of awaited
+            with open(audio_path, "rb") as audio_file, deferred_inserts():
+                result = process_recording(audio_file, audio_path.name, image_data, mode=mode)
+            error = result.get("error")
+        except Exception as e:
+            result, error = {"status": "error"}, str(e)
+        manifest.update(key, status=result["status"], error=error, finished_at=datetime.now().isoformat())
+        logger.info("%s: %s%s", key, result["status"], f" ({error})" if error else "")
+        reset_request_id(token)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(process, pending))
+    flush_inserts()
+    image_store.close()
+    return manifest.summary()
+
+def main():
+    from agent import PIPELINE_MODES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="folder with recordings and optional images")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help=f"recordings processed at the same time (at most {BATCH_MAX_CONCURRENCY})")
+    parser.add_argument("--mode", default=None, type=str.lower, choices=PIPELINE_MODES, help="pipeline mode (default: PIPELINE_MODE)")
+    parser.add_argument("--manifest", default=None, help=f"manifest path (default: FOLDER/{MANIFEST_NAME})")
+    parser.add_argument("--images-dir", default=None, help="where images are stored (default: the server's images folder)")
+    args = parser.parse_args()
+
+    images_dir = args.images_dir
+    if not images_dir:
+        from images import IMAGES_DIR
+        images_dir = IMAGES_DIR
+
+    summary = run_batch(args.folder, images_dir, args.manifest, args.concurrency, args.mode)
+    logger.info("Finished: %d recording(s) in manifest, %s", summary["total"], summary["counts"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare the bytes sent to Whisper and the latency of convert_audio_format
+for the "wav" (previous) and "compact" preprocessing modes, per input format.
+
+Inputs are synthetic speech-like recordings (tones with pauses) encoded with
+ffmpeg through pydub. With --whisper, each converted file is also sent to
+whisper-1 (needs OPENAI_API_KEY) to measure end-to-end latency.
+
+Usage: python benchmarks/bench_audio_preprocess.py [--seconds 60] [--whisper]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+# Input formats as a browser or phone would upload them: (name, export kwargs)
+INPUT_FORMATS = [
+    ("wav", {"format": "wav"}),
+    ("webm", {"format": "webm", "codec": "libopus"}),
+    ("m4a", {"format": "ipod", "codec": "aac"}),
+    ("mp3", {"format": "mp3"}),
+    ("aac", {"format": "adts", "codec": "aac"}),
+    ("amr", {"format": "amr", "codec": "libopencore_amrnb", "parameters": ["-ar", "8000", "-ac", "1"]}),
+]
+
+def make_recording(seconds):
+    """44.1 kHz stereo audio alternating short tones and silences, like speech with pauses."""
+    audio = AudioSegment.silent(duration=0, frame_rate=44100)
+    frequencies = [220, 330, 440, 280, 370]
+    for i in range(seconds):
+        tone = Sine(frequencies[i % len(frequencies)]).to_audio_segment(duration=700).apply_gain(-12)
+        audio += tone + AudioSegment.silent(duration=300, frame_rate=44100)
+    return audio.set_channels(2)
+
+def encode(audio, name, export_kwargs):
+    buffer = io.BytesIO()
+    audio.export(buffer, **export_kwargs)
+    buffer.name = f"recording.{name}"
+    buffer.seek(0)
+    return buffer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60, help="recording length")
+    parser.add_argument("--whisper", action="store_true", help="also time the whisper-1 call")
+    args = parser.parse_args()
+
+    os.environ["TRANSCRIPT_CACHE_DIR"] = ""
+    import agent
+
+    recording = make_recording(args.seconds)
+    print(f"{args.seconds}s recording")
+    print(f"{'input':<6} {'mode':<8} {'input bytes':>12} {'sent bytes':>12} {'sent as':<22} {'convert ms':>10} {'whisper ms':>10}")
+
+    for name, export_kwargs in INPUT_FORMATS:
+        try:
+            source = encode(recording, name, export_kwargs)
+        except Exception as e:
+            print(f"{name:<6} skipped: cannot encode ({e})")
+            continue
+        input_bytes = len(source.getvalue())
+
+        for mode in ("wav", "compact"):
+            agent.AUDIO_PREPROCESS = mode
+            agent.transcript_cache.memory.clear()
+            source.seek(0)
+
+            start = time.perf_counter()
+            converted = agent.convert_audio_format(source)
+            convert_ms = (time.perf_counter() - start) * 1000
+            converted.seek(0, io.SEEK_END)
+            sent_bytes = converted.tell()
+            converted.seek(0)
+
+            whisper_ms = "-"
+            if args.whisper:
+                start = time.perf_counter()
+                agent.transcribe_audio(converted)
+                whisper_ms = f"{(time.perf_counter() - start) * 1000:.0f}"
+
+            print(f"{name:<6} {mode:<8} {input_bytes:>12} {sent_bytes:>12} {converted.name:<22} {convert_ms:>10.0f} {whisper_ms:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Event-loop responsiveness under upload load, driven through the ASGI app.
+
+Polls /health (answered on the event loop) and /api/feedback/stats (a MongoDB
+read on the shared threadpool) first with the server idle, then while
+--concurrency uploads to /process_audio are kept in flight. If anything in
+the upload path blocks the event loop, or the pipelines use up the threads
+the other endpoints need, the loaded latencies climb far above the idle ones.
+
+OpenAI is replaced by the fake backends (CRM_BACKEND=fake, with the latencies
+below) and MongoDB by an in-memory mongomock client, so no network is needed.
+Recordings are sent as WebM-named bytes that go to the transcriber unchanged
+by default; --audio wav uploads WAV files that are transcoded (needs ffmpeg).
+
+tests/test_health_latency.py runs the same check with a fixed bound.
+
+Needs: pip install httpx mongomock
+
+Usage: python benchmarks/bench_health_latency.py [--concurrency 48] [--duration 10]
+       [--transcribe-ms 800] [--extract-ms 1200]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_pipeline import make_recording, percentiles
+
+PROBES = ("/health", "/api/feedback/stats")
+PROBE_INTERVAL_SECONDS = 0.02
+
+async def probe(client, path, duration):
+    """Request `path` one at a time for `duration` seconds; returns latencies in ms."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+    return latencies
+
+async def probe_all(client, duration):
+    results = await asyncio.gather(*(probe(client, path, duration) for path in PROBES))
+    return {path: percentiles(latencies) for path, latencies in zip(PROBES, results)}
+
+async def upload_loop(client, audio, counter, stop, stats):
+    """Upload recordings back to back until `stop` is set."""
+    while not stop.is_set():
+        filename, content_type, content = make_recording(1, audio, next(counter))
+        response = await client.post("/process_audio", files={"file": (filename, content, content_type)})
+        if response.status_code == 200 and response.json().get("status") == "success":
+            stats["uploads"] += 1
+        else:
+            stats["errors"] += 1
+
+async def run(args):
+    import httpx
+    import mongomock
+    import db
+    import app
+
+    # In-memory MongoDB stand-in, used through the normal db.get_client() path
+    db._client = mongomock.MongoClient()
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        counter = itertools.count()
+        # The pipeline modules are imported on the first upload; keep that out of the numbers
+        filename, content_type, content = make_recording(1, args.audio, next(counter))
+        await client.post("/process_audio", files={"file": (filename, content, content_type)})
+
+        idle = await probe_all(client, args.duration)
+
+        stop = asyncio.Event()
+        stats = {"uploads": 0, "errors": 0}
+        uploaders = [asyncio.create_task(upload_loop(client, args.audio, counter, stop, stats)) for _ in range(args.concurrency)]
+        # Let the uploads fill the pipeline before measuring
+        await asyncio.sleep(args.warmup)
+        loaded = await probe_all(client, args.duration)
+        stop.set()
+        await asyncio.gather(*uploaders)
+
+    return idle, loaded, stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=48, help="uploads kept in flight")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of polling per phase")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of upload load before polling")
+    parser.add_argument("--audio", choices=["wav", "passthrough"], default="passthrough")
+    parser.add_argument("--transcribe-ms", type=float, default=800, help="fake transcription latency")
+    parser.add_argument("--extract-ms", type=float, default=1200, help="fake extraction latency")
+    args = parser.parse_args()
+
+    # Configure the stand-ins before the app modules are imported
+    os.environ["CRM_BACKEND"] = "fake"
+    os.environ["TRANSCRIPTION_BACKEND"] = "fake"
+    os.environ["EXTRACTION_BACKEND"] = "fake"
+    os.environ["FAKE_TRANSCRIBE_LATENCY_MS"] = str(args.transcribe_ms)
+    os.environ["FAKE_EXTRACT_LATENCY_MS"] = str(args.extract_ms)
+    os.environ["TRANSCRIPT_CACHE_DIR"] = ""
+    os.environ["MONGO_URI"] = "mongodb://bench"
+
+    print(f"fake latencies: transcribe={args.transcribe_ms} ms, extract={args.extract_ms} ms, {args.concurrency} uploads in flight")
+    idle, loaded, stats = asyncio.run(run(args))
+
+    for path in PROBES:
+        for phase, results in (("idle", idle), ("uploading", loaded)):
+            latency = results[path]
+            print(f"{path:<22} {phase:<10} p50={latency['p50']:7.2f} p95={latency['p95']:7.2f} p99={latency['p99']:7.2f} ms  ({latency['count']} requests)")
+    print(f"uploads completed while polling: {stats['uploads']}" + (f", errors: {stats['errors']}" if stats["errors"] else ""))
+
+if __name__ == "__main__":
+    main()
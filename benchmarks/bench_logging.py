@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Per-request logging overhead of the upload pipeline at each LOG_LEVEL.
+
+Runs process_recording with the fake backends (no latency) and an in-memory
+mongomock collection, with log output going to /dev/null, so the difference
+between levels is the cost of building and writing log lines. DEBUG formats
+the full record, prompt response and transcript payloads, like the print
+statements it replaced; INFO writes one short line per step.
+
+Needs: pip install mongomock
+
+Usage: python benchmarks/bench_logging.py [--requests 2000] [--format text|json]
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+os.environ["CRM_BACKEND"] = "fake"
+os.environ["TRANSCRIPTION_BACKEND"] = "fake"
+os.environ["EXTRACTION_BACKEND"] = "fake"
+os.environ["FAKE_TRANSCRIBE_LATENCY_MS"] = "0"
+os.environ["FAKE_EXTRACT_LATENCY_MS"] = "0"
+os.environ["FAKE_LATENCY_JITTER_MS"] = "0"
+os.environ["TRANSCRIPT_CACHE_DIR"] = ""
+os.environ["MONGO_URI"] = "mongodb://bench"
+
+LEVELS = ("CRITICAL", "INFO", "DEBUG")
+
+def run(requests, level, fmt, devnull):
+    import agent
+    from logging_config import configure_logging, set_request_id, reset_request_id
+
+    import mongomock
+    import db
+
+    # A fresh collection per level, so every level inserts into the same amount of data
+    db._client = mongomock.MongoClient()
+    configure_logging(level, fmt, stream=devnull)
+    timings = []
+    for i in range(requests):
+        recording = io.BytesIO(f"bench-{level}-{i}".encode())
+        token = set_request_id()
+        start = time.perf_counter()
+        agent.process_recording(recording, f"recording_{i}.webm")
+        timings.append((time.perf_counter() - start) * 1_000_000)
+        reset_request_id(token)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        run(50, "INFO", args.format, devnull)  # warm up imports and caches
+        results = {level: run(args.requests, level, args.format, devnull) for level in LEVELS}
+
+    baseline = statistics.median(results["CRITICAL"])
+    print(f"{args.requests} requests per level, {args.format} format")
+    print(f"{'level':<9} {'median us':>10} {'p95 us':>10} {'logging us':>11}")
+    for level in LEVELS:
+        timings = sorted(results[level])
+        median = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{level:<9} {median:>10.1f} {p95:>10.1f} {median - baseline:>11.1f}")
+    print(f"INFO saves {statistics.median(results['DEBUG']) - statistics.median(results['INFO']):.1f} us per request compared to DEBUG")
+
+if __name__ == "__main__":
+    main()
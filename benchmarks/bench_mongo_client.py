@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-call latency of db.py lookups with a new MongoClient per call
+(the old behaviour) versus the shared, pooled client from db.get_client().
+
+Runs against MONGO_URI, or a local mongod at mongodb://localhost:27017.
+Uses a scratch collection that is dropped at the end.
+
+Usage: python benchmarks/bench_mongo_client.py [--calls 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pymongo import MongoClient
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import db
+
+BENCH_COLLECTION = "returned_cust_bench"
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<22} mean={statistics.mean(timings):8.2f} ms  p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+
+def new_client_per_call(mongo_uri, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = MongoClient(mongo_uri)
+        client["crm"][BENCH_COLLECTION].find_one({"salesperson_name": "Bench"})
+        client.close()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def shared_client(calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        db.get_client()["crm"][BENCH_COLLECTION].find_one({"salesperson_name": "Bench"})
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    mongo_uri = os.environ["MONGO_URI"]
+    collection = db.get_client()["crm"][BENCH_COLLECTION]
+    collection.insert_one({"salesperson_name": "Bench"})
+
+    try:
+        print(f"MongoDB: {mongo_uri}, {args.calls} calls each")
+        report("new client per call", new_client_per_call(mongo_uri, args.calls))
+        report("shared pooled client", shared_client(args.calls))
+    finally:
+        collection.drop()
+        db.close_client()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark feedback insert throughput: one insert_one round trip per record
+(the default) versus the write-behind InsertBuffer, both with callers waiting
+for their own acknowledgement and with records only queued (as batch
+ingestion does with MONGO_WRITE_BEHIND on).
+
+Runs against MONGO_URI, or a local mongod at mongodb://localhost:27017.
+Uses a scratch collection that is dropped at the end.
+
+Usage: python benchmarks/bench_mongo_inserts.py [--records 5000] [--threads 8] [--batch-size 100]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import db
+
+BENCH_COLLECTION = "returned_cust_bench"
+
+def sample_record(index):
+    record = {name: None for name in db.STATS_FIELDS}
+    record.update({"salesperson_name": "Bench", "original_text": f"Bench record {index} " + "x" * 400})
+    return record
+
+def run(label, records, threads, save):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(save, (sample_record(i) for i in range(records))))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {records / elapsed:9.0f} records/s  ({elapsed:.2f} s)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=db.MONGO_BATCH_SIZE)
+    parser.add_argument("--max-delay-ms", type=int, default=db.MONGO_BATCH_MAX_DELAY_MS)
+    args = parser.parse_args()
+
+    collection = db.get_client()["crm"][BENCH_COLLECTION]
+    buffer = db.InsertBuffer(args.batch_size, args.max_delay_ms, collection_getter=lambda: collection)
+
+    def queued(record):
+        buffer.submit(record)
+
+    try:
+        print(f"MongoDB: {os.environ['MONGO_URI']}, {args.records} records, {args.threads} threads, batch size {args.batch_size}")
+        run("insert_one per record", args.records, args.threads, collection.insert_one)
+        run("write-behind, acknowledged", args.records, args.threads, lambda record: buffer.submit(record, wait=True).result())
+        start = time.perf_counter()
+        run("write-behind, queued", args.records, args.threads, queued)
+        buffer.flush()
+        print(f"{'  ... including final flush':<28} {args.records / (time.perf_counter() - start):9.0f} records/s")
+    finally:
+        buffer.close()
+        collection.drop()
+        db.close_client()
+
+if __name__ == "__main__":
+    main()
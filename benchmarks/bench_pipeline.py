@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the upload pipeline, driven through the ASGI app.
+
+POSTs recordings to /process_audio and then reads them back through
+/api/feedback at several concurrency levels and recording lengths. OpenAI is
+replaced by the fake backends (CRM_BACKEND=fake, with the latencies below)
+and MongoDB by an in-memory mongomock client, so no network is needed.
+
+Reports p50/p95/p99 latency and throughput per scenario, and the same
+percentiles for each pipeline stage (convert, transcribe, extract, save)
+from the stage timings returned by the direct pipeline. The full results
+are written as JSON for comparison between releases.
+
+Recordings are 16 kHz mono WAV by default, which exercises the compact
+conversion (needs ffmpeg). --audio passthrough uploads WebM-named bytes that
+are sent to the transcriber unchanged, for machines without ffmpeg.
+
+Needs: pip install httpx mongomock
+
+Usage: python benchmarks/bench_pipeline.py [--concurrency 1 4 16] [--seconds 10 60 300]
+       [--requests 32] [--transcribe-ms 800] [--extract-ms 1200] [--output bench_pipeline.json]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+STAGES = ("convert", "transcribe", "extract", "save")
+
+def percentiles(values):
+    """p50/p95/p99 (nearest rank), mean and count of a list of milliseconds."""
+    if not values:
+        return None
+    values = sorted(values)
+    def rank(p):
+        return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2),
+        "p50": round(rank(50), 2),
+        "p95": round(rank(95), 2),
+        "p99": round(rank(99), 2),
+    }
+
+def make_recording(seconds, audio, index):
+    """A recording of the given length; the index makes every upload unique so no cache is hit."""
+    if audio == "passthrough":
+        # Roughly the size of a 24 kbit/s Opus recording
+        size = seconds * 3000
+        header = f"recording-{index}-".encode()
+        return f"recording_{index}.webm", "audio/webm", header + os.urandom(max(0, size - len(header)))
+
+    from pydub import AudioSegment
+    from pydub.generators import Sine
+    tone = Sine(220 + index % 200).to_audio_segment(duration=700).apply_gain(-12)
+    second = tone + AudioSegment.silent(duration=300, frame_rate=16000)
+    recording = (second * seconds).set_frame_rate(16000).set_channels(1)
+    buffer = io.BytesIO()
+    recording.export(buffer, format="wav")
+    return f"recording_{index}.wav", "audio/wav", buffer.getvalue()
+
+async def run_scenario(client, concurrency, seconds, requests, audio, start_index):
+    """Upload `requests` recordings with at most `concurrency` in flight, then read them back."""
+    recordings = [make_recording(seconds, audio, start_index + i) for i in range(requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    upload_ms, stage_ms, errors = [], {stage: [] for stage in STAGES}, 0
+
+    async def upload(recording):
+        nonlocal errors
+        filename, content_type, content = recording
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/process_audio", files={"file": (filename, content, content_type)})
+            upload_ms.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200 or response.json().get("status") != "success":
+            errors += 1
+            return
+        for stage, ms in response.json()["agent_result"].get("timings_ms", {}).items():
+            stage_ms.setdefault(stage, []).append(ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(recording) for recording in recordings))
+    upload_wall = time.perf_counter() - start
+
+    read_ms = []
+    async def read(_):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get("/api/feedback", params={"limit": 50})
+            response.raise_for_status()
+            read_ms.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(read(i) for i in range(requests)))
+    read_wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "requests": requests,
+        "upload_bytes": len(recordings[0][2]),
+        "errors": errors,
+        "process_audio": {
+            "latency_ms": percentiles(upload_ms),
+            "throughput_rps": round(requests / upload_wall, 2),
+        },
+        "stages_ms": {stage: percentiles(values) for stage, values in stage_ms.items()},
+        "api_feedback": {
+            "latency_ms": percentiles(read_ms),
+            "throughput_rps": round(requests / read_wall, 2),
+        },
+    }
+
+async def run(args):
+    import httpx
+    import mongomock
+    import db
+    import app
+
+    # In-memory MongoDB stand-in, used through the normal db.get_client() path
+    db._client = mongomock.MongoClient()
+
+    transport = httpx.ASGITransport(app=app.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        # The pipeline modules are imported on the first upload; keep that out of the numbers
+        filename, content_type, content = make_recording(1, args.audio, -1)
+        await client.post("/process_audio", files={"file": (filename, content, content_type)})
+
+        index = 0
+        for seconds in args.seconds:
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, concurrency, seconds, args.requests, args.audio, index)
+                index += args.requests
+                results.append(result)
+                upload, stages = result["process_audio"], result["stages_ms"]
+                print(
+                    f"{seconds:>5}s  c={concurrency:<3} "
+                    f"process_audio p50={upload['latency_ms']['p50']:8.1f} p95={upload['latency_ms']['p95']:8.1f} "
+                    f"p99={upload['latency_ms']['p99']:8.1f} ms  {upload['throughput_rps']:6.2f} req/s  "
+                    + "  ".join(f"{stage}={stages[stage]['p50']:.1f}" for stage in STAGES if stages.get(stage))
+                    + f"  api/feedback p50={result['api_feedback']['latency_ms']['p50']:.1f} ms"
+                    + (f"  errors={result['errors']}" if result["errors"] else "")
+                )
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=int, nargs="+", default=[10, 60, 300], help="recording lengths")
+    parser.add_argument("--requests", type=int, default=32, help="uploads per scenario")
+    parser.add_argument("--audio", choices=["wav", "passthrough"], default="wav")
+    parser.add_argument("--transcribe-ms", type=float, default=800, help="fake transcription latency")
+    parser.add_argument("--extract-ms", type=float, default=1200, help="fake extraction latency")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    args = parser.parse_args()
+
+    # Configure the stand-ins before the app modules are imported
+    os.environ["CRM_BACKEND"] = "fake"
+    os.environ["TRANSCRIPTION_BACKEND"] = "fake"
+    os.environ["EXTRACTION_BACKEND"] = "fake"
+    os.environ["FAKE_TRANSCRIBE_LATENCY_MS"] = str(args.transcribe_ms)
+    os.environ["FAKE_EXTRACT_LATENCY_MS"] = str(args.extract_ms)
+    os.environ["TRANSCRIPT_CACHE_DIR"] = ""
+    os.environ["MONGO_URI"] = "mongodb://bench"
+
+    print(f"fake latencies: transcribe={args.transcribe_ms} ms, extract={args.extract_ms} ms, {args.requests} uploads per scenario")
+    results = asyncio.run(run(args))
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from logging_config import get_logger
+
+logger = get_logger("cache")
+
+def content_hash(file_obj, chunk_size=1024 * 1024):
+    """SHA-256 of a file-like object's contents (or bytes), read in chunks."""
+    digest = hashlib.sha256()
+    if isinstance(file_obj, (bytes, bytearray)):
+        digest.update(file_obj)
+        return digest.hexdigest()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with optional TTL and hit/miss counters."""
+
+    def __init__(self, max_entries=256, ttl_seconds=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self.ttl_seconds and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class DiskCache:
+    """
+    JSON values stored as one file per key in a directory.
+    Bounded by entry count (least recently used files are evicted first)
+    and by TTL, both based on file modification times.
+    """
+
+    def __init__(self, directory, max_entries=10000, ttl_seconds=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._count = sum(1 for _ in self.directory.glob("*.json"))
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return self.directory / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            mtime = path.stat().st_mtime
+            if self.ttl_seconds and time.time() - mtime > self.ttl_seconds:
+                self._remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        existed = path.exists()
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if not existed:
+                self._count += 1
+            over_limit = self._count > self.max_entries
+        if over_limit:
+            self._evict()
+
+    def _remove(self, path):
+        try:
+            path.unlink()
+            with self._lock:
+                self._count -= 1
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Remove expired entries, then the least recently used ones down to 90% of the limit."""
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass
+        entries.sort()
+        now = time.time()
+        keep = int(self.max_entries * 0.9)
+        removed = 0
+        for i, (mtime, path) in enumerate(entries):
+            expired = self.ttl_seconds and now - mtime > self.ttl_seconds
+            if expired or len(entries) - i > keep:
+                try:
+                    path.unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._count = len(entries) - removed
+
+    def stats(self):
+        return {"entries": self._count, "hits": self.hits, "misses": self.misses}
+
+class TieredCache:
+    """Memory LRU in front of an optional disk tier; disk hits are promoted to memory."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except OSError as e:
+                logger.warning("Could not write disk cache entry: %s", e)
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        stats["hits"] = self.memory.hits + (self.disk.hits if self.disk is not None else 0)
+        # A lookup only misses overall when the last tier misses
+        stats["misses"] = self.disk.misses if self.disk is not None else self.memory.misses
+        return stats
@@ -1,45 +1,268 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
 import os
 import json
+import base64
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
 from datetime import datetime
 from bson import ObjectId
+from metrics import stage_timer, FALLBACKS, INSERT_BUFFER_PENDING
+from logging_config import get_logger
+from spool import Spool, SpoolReplayer
 
 load_dotenv()
 
+logger = get_logger("db")
+
+# MongoDB connection pool configuration
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+
+# Write-behind inserts: records are grouped into insert_many batches by size or age
+MONGO_WRITE_BEHIND = os.getenv("MONGO_WRITE_BEHIND", "false").strip().lower() in ("1", "true", "yes")
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "100"))
+MONGO_BATCH_MAX_DELAY_MS = int(os.getenv("MONGO_BATCH_MAX_DELAY_MS", "200"))
+# Callers block once this many records are waiting, which bounds the memory used
+MONGO_BATCH_MAX_PENDING = int(os.getenv("MONGO_BATCH_MAX_PENDING", "5000"))
+MONGO_INSERT_ACK_TIMEOUT_SECONDS = float(os.getenv("MONGO_INSERT_ACK_TIMEOUT_SECONDS", "30"))
+
+# Records fetched per cursor round trip when reading feedback; /api/feedback sends them in chunks of the same size
+FEEDBACK_READ_BATCH_SIZE = int(os.getenv("FEEDBACK_READ_BATCH_SIZE", "500"))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Return the process-wide MongoClient, creating it on first use.
+    MongoClient is thread-safe and keeps its own connection pool, so one
+    client is shared by every request. Returns None if MONGO_URI is not set.
+    """
+    global _client
+    if _client is None:
+        mongo_uri = os.getenv("MONGO_URI")
+        if not mongo_uri:
+            return None
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    mongo_uri,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                )
+    return _client
+
+def get_collection():
+    """Return crm.returned_cust on the shared client, or None if MONGO_URI is not set."""
+    client = get_client()
+    if client is None:
+        return None
+    return client["crm"]["returned_cust"]
+
+def close_client():
+    """Flush pending inserts and close the shared client; the next call to get_client() creates a new one."""
+    global _client, _insert_buffer
+    with _insert_buffer_lock:
+        if _insert_buffer is not None:
+            _insert_buffer.close()
+            _insert_buffer = None
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+class InsertBuffer:
+    """
+    Write-behind buffer for crm.returned_cust. submit() queues a record and
+    returns a Future; a background thread inserts queued records with
+    insert_many once MONGO_BATCH_SIZE are waiting or the oldest has waited
+    MONGO_BATCH_MAX_DELAY_MS. Each Future resolves when its own record is
+    acknowledged, or fails with the error for that record. Records submitted
+    with wait=True are written as soon as the previous batch is done, together
+    with whatever else has queued up by then, so callers waiting for an
+    acknowledgement do not also wait out the batch delay.
+    """
+
+    def __init__(self, batch_size=MONGO_BATCH_SIZE, max_delay_ms=MONGO_BATCH_MAX_DELAY_MS, max_pending=MONGO_BATCH_MAX_PENDING,
+                 collection_getter=None):
+        self.collection_getter = collection_getter or get_collection
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay_ms / 1000
+        self.max_pending = max(self.batch_size, max_pending)
+        self._pending = deque()  # (queued_at, record, future, wait)
+        self._waiting = 0  # Pending records whose caller waits for the acknowledgement
+        self._in_flight = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="insert-buffer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record, wait=False):
+        """Queue a record; returns a Future for its acknowledgement (its _id)."""
+        future = Future()
+        with self._condition:
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                raise RuntimeError("Insert buffer is closed")
+            self._pending.append((time.monotonic(), record, future, wait))
+            self._waiting += wait
+            INSERT_BUFFER_PENDING.inc()
+            self._condition.notify_all()
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until every record submitted so far has been written. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Write the remaining records and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._pending:
+                    age = time.monotonic() - self._pending[0][0]
+                    if len(self._pending) >= self.batch_size or age >= self.max_delay or self._waiting or self._closed:
+                        break
+                    self._condition.wait(self.max_delay - age)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            self._waiting -= sum(wait for _, _, _, wait in batch)
+            self._in_flight += len(batch)
+            INSERT_BUFFER_PENDING.dec(len(batch))
+            self._condition.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            finally:
+                with self._condition:
+                    self._in_flight -= len(batch)
+                    self._condition.notify_all()
+
+    def _write(self, batch):
+        errors = {}
+        try:
+            collection = self.collection_getter()
+            if collection is None:
+                raise RuntimeError("No MONGO_URI found")
+            with stage_timer("mongo_insert_many"):
+                collection.insert_many([record for _, record, _, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            # ordered=False: every record was attempted; only the listed ones failed
+            for error in e.details.get("writeErrors", []):
+                errors[error["index"]] = RuntimeError(error.get("errmsg", "insert failed"))
+        except Exception as e:
+            errors = {index: e for index in range(len(batch))}
+        if errors:
+            logger.error("insert_many: %d of %d records failed", len(errors), len(batch))
+        else:
+            logger.debug("insert_many: %d records inserted", len(batch))
+        for index, (_, record, future, _) in enumerate(batch):
+            if index in errors:
+                future.set_exception(errors[index])
+            else:
+                future.set_result(record["_id"])
+
+_insert_buffer = None
+_insert_buffer_lock = threading.Lock()
+
+# False while inside deferred_inserts(): save_feedback returns once the record is queued
+_wait_for_insert = ContextVar("wait_for_insert", default=True)
+
+def get_insert_buffer():
+    """The shared InsertBuffer, or None when MONGO_WRITE_BEHIND is off."""
+    global _insert_buffer
+    if not MONGO_WRITE_BEHIND:
+        return None
+    with _insert_buffer_lock:
+        if _insert_buffer is None:
+            _insert_buffer = InsertBuffer()
+        return _insert_buffer
+
+@contextmanager
+def deferred_inserts():
+    """
+    Within this block save_feedback does not wait for MongoDB to acknowledge
+    the record (when write-behind is on). A record that then fails to insert
+    is saved with save_to_json. Call flush_inserts() to wait for all of them.
+    """
+    token = _wait_for_insert.set(False)
+    try:
+        yield
+    finally:
+        _wait_for_insert.reset(token)
+
+def flush_inserts(timeout=None):
+    """Wait for queued write-behind inserts. Returns False on timeout."""
+    buffer = _insert_buffer
+    return buffer.flush(timeout) if buffer is not None else True
+
+def _save_to_json_on_failure(data):
+    def callback(future):
+        if future.exception() is not None:
+            logger.error("Deferred insert of %s failed, saving to local JSON file: %s", data["feedback_id"], future.exception())
+            save_to_json(data)
+    return callback
+
 def save_feedback(data: dict):
     """
     Save structured feedback data into MongoDB (Railway)
     under db = crm, collection = returned_cust.
     Falls back to local JSON if connection fails.
     """
-    print(f"SAVE_FEEDBACK CALLED - Data type: {type(data)}")
-    print(f"SAVE_FEEDBACK CALLED - Data preview: {str(data)[:200]}...")
-    print(f"SAVE_FEEDBACK CALLED - Data length: {len(str(data))}")
-    print(f"SAVE_FEEDBACK CALLED - First 10 chars: {repr(str(data)[:10])}")
-    print(f"SAVE_FEEDBACK CALLED - Last 10 chars: {repr(str(data)[-10:])}")
+    logger.debug("save_feedback called with %s: %.200s", type(data).__name__, data)
     
     try:
-        mongo_uri = os.getenv("MONGO_URI")
+        # Shared MongoDB (Railway) client: db = crm, collection = returned_cust
+        collection = get_collection()
 
-        if not mongo_uri:
-            print("No MONGO_URI found, saving to local JSON file instead.")
+        if collection is None:
+            logger.warning("No MONGO_URI found, saving to local JSON file instead")
             return save_to_json(data)
 
-        # Connect to MongoDB (Railway)
-        client = MongoClient(mongo_uri)
-        db = client["crm"]                  # Database name: crm
-        collection = db["returned_cust"]    # Collection name: returned_cust
-
         # Ensure data is dictionary - handle both dict and string inputs
         if isinstance(data, str):
-            print(f"Processing string data: {data[:100]}...")
+            logger.debug("Processing string data: %.100s", data)
             try:
                 # Try to parse as JSON first
                 data = json.loads(data)
-                print("JSON parsing succeeded")
             except json.JSONDecodeError as e:
-                print(f"JSON parsing failed: {e}")
+                logger.debug("JSON parsing failed: %s", e)
                 # If it's a string representation of a dict, try conversion
                 try:
                     # Handle string representations like "{'key': 'value'}"
@@ -47,23 +270,18 @@ def save_feedback(data: dict):
                     cleaned_data = data.strip()
                     
                     if cleaned_data.startswith('{') and cleaned_data.endswith('}'):
-                        print("Detected string dictionary format")
                         # Replace None with null for JSON parsing
                         json_str = cleaned_data.replace('None', 'null').replace("'", '"')
-                        print(f"Converted JSON string: {json_str[:100]}...")
                         data = json.loads(json_str)
-                        print("String-to-dict conversion succeeded")
-                        print(f"Converted to dict with {len(data)} keys: {list(data.keys())[:5]}...")
+                        logger.debug("Converted string dictionary to dict with %d keys", len(data))
                     else:
-                        print("Not a string dictionary format, wrapping in raw_data")
+                        logger.warning("Feedback is not a dictionary, saving it as raw_data")
                         data = {"raw_data": data}
                 except Exception as e:
-                    print(f"String-to-dict conversion failed: {e}")
-                    print(f"Failed string: {repr(data[:100])}")
+                    logger.warning("String-to-dict conversion failed, saving it as raw_data: %s", e)
                     data = {"raw_data": data}
         elif isinstance(data, dict):
             # Data is already a dictionary - use it directly
-            print(f"Data is already a dictionary with {len(data)} keys")
             pass
         else:
             # Unknown data type - wrap it
@@ -72,114 +290,336 @@ def save_feedback(data: dict):
         # Add timestamp
         data["created_at"] = datetime.utcnow()
         
-        print(f"FINAL DATA TO INSERT - Type: {type(data)}")
-        print(f"FINAL DATA TO INSERT - Keys: {list(data.keys())}")
-        print(f"FINAL DATA TO INSERT - Sample: {dict(list(data.items())[:3])}")
-        print(f"FINAL DATA TO INSERT - Has raw_data key: {'raw_data' in data}")
-        if 'raw_data' in data:
-            print(f"FINAL DATA TO INSERT - raw_data value: {str(data['raw_data'])[:100]}...")
+        # Assign the id up front so its string form can be stored for prefix lookups
+        data.setdefault("_id", ObjectId())
+        data["feedback_id"] = str(data["_id"])
+        
+        logger.debug("Inserting record: %s", data)
 
-        collection.insert_one(data)
-        print("Data inserted into Railway MongoDB: crm.returned_cust")
+        buffer = get_insert_buffer()
+        if buffer is not None and not _wait_for_insert.get():
+            buffer.submit(data).add_done_callback(_save_to_json_on_failure(data))
+            logger.debug("Queued feedback %s for crm.returned_cust", data["feedback_id"])
+            return {"status": "queued for MongoDB", "collection": "returned_cust"}
+        if buffer is not None:
+            # Inserted with other records in the same batch; waits for this record's acknowledgement
+            with stage_timer("mongo_insert"):
+                buffer.submit(data, wait=True).result(MONGO_INSERT_ACK_TIMEOUT_SECONDS)
+        else:
+            with stage_timer("mongo_insert"):
+                collection.insert_one(data)
+        logger.debug("Inserted feedback %s into crm.returned_cust", data["feedback_id"])
 
         return {"status": "saved to MongoDB", "collection": "returned_cust"}
 
     except Exception as e:
-        print(f"MongoDB insert failed: {e}")
+        logger.error("MongoDB insert failed, saving to local JSON file: %s", e)
         return save_to_json(data)
 
 
+feedback_spool = Spool()
+spool_replayer = SpoolReplayer(feedback_spool, get_collection)
+
 def save_to_json(data: dict):
-    """Fallback: save feedback to local JSON file if MongoDB fails"""
+    """
+    Fallback: append feedback to the local spool if MongoDB fails.
+    spool_replayer inserts it into crm.returned_cust once the database is reachable.
+    """
+    FALLBACKS.labels(kind="save_to_json").inc()
     try:
-        os.makedirs("feedback_data", exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"feedback_data/feedback_{timestamp}.json"
-
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        if not isinstance(data, dict):
+            data = {"raw_data": str(data)}
+        # Fixed before spooling, so a replayed record keeps its id and is inserted at most once
+        data.setdefault("created_at", datetime.utcnow())
+        data.setdefault("_id", ObjectId())
+        data["feedback_id"] = str(data["_id"])
 
+        filename = feedback_spool.append(data)
+        logger.info("Spooled feedback %s to %s", data["feedback_id"], filename)
         return {"status": "saved to local file", "filename": filename}
 
     except Exception as e:
+        logger.error("Could not save feedback to a local file: %s", e)
         return {"status": "failed to save", "error": str(e)}
 
-def get_filtered_feedback(filters):
-    """Get filtered feedback data based on comprehensive filters."""
+# Maps API filter names to feedback record fields
+FILTER_FIELDS = {
+    "salesperson": "salesperson_name",
+    "itemType": "item_type",
+    "metalType": "metal_type",
+    "customerIntent": "customer_intent",
+    "designPreference": "design_preference",
+    "customerMood": "customer_mood",
+    "storeImpression": "store_impression",
+    "customerSupport": "customer_support",
+    "priceIssue": "reason_price",
+    "sizeIssue": "reason_size"
+}
+
+# /api/feedback/stats also applies the other exact-match dropdowns of the dashboard
+# tables, so the stat cards count the same rows as the table below them. Kept apart
+# from FILTER_FIELDS, which also drives the index plan: an aggregation runs once
+# per filter change and does not need an index per field.
+STATS_FILTER_FIELDS = {
+    **FILTER_FIELDS,
+    "purchased": "purchased",
+    "typeOfCustomer": "type_of_customer",
+    "mSource": "M_Source",
+    "designType": "design_type",
+    "weightIssue": "reason_weight",
+    "zeroMaking": "reason_zeromaking",
+    "designOutOfStock": "reason_design_outofstock",
+    "designNew": "reason_design_new",
+}
+
+# Supported sort orders; keyset pagination always breaks ties on _id
+SORT_ORDERS = {"-created_at": -1, "created_at": 1}
+
+# Index plan for crm.returned_cust: the default newest-first sort, plus one compound
+# index per dashboard filter so filtered queries are served in sort order
+FEEDBACK_INDEXES = [
+    IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+    IndexModel([("feedback_id", ASCENDING)], name="feedback_id"),
+    # Checked on delete: is the image still used by another record?
+    IndexModel([("image_url", ASCENDING)], name="image_url", sparse=True),
+] + [
+    IndexModel([(field, ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name=f"{field}_created_at")
+    for field in FILTER_FIELDS.values()
+]
+
+OBJECT_ID_PATTERN = re.compile(r"[0-9a-f]{24}")
+
+def ensure_indexes():
+    """Create the FEEDBACK_INDEXES plan. Safe to call on every startup."""
     try:
-        mongo_uri = os.getenv("MONGO_URI")
+        collection = get_collection()
         
-        if not mongo_uri:
-            print("No MONGO_URI found, returning empty list.")
+        if collection is None:
+            logger.info("No MONGO_URI found, skipping index creation")
             return []
 
-        # Connect to MongoDB (Railway)
-        client = MongoClient(mongo_uri)
-        db = client["crm"]
-        collection = db["returned_cust"]
+        names = collection.create_indexes(FEEDBACK_INDEXES)
+        logger.info("Indexes ensured on crm.returned_cust: %s", names)
+        return names
 
-        print(f"Filters received: {filters}")
-        
-        # Build MongoDB query
-        query = {}
-        
-        # Search across multiple fields
-        if filters.get("feedbackId"):
-            search_term = filters["feedbackId"]
-            query["_id"] = {"$regex": search_term, "$options": "i"}
-        
-        # Field-specific filters
-        filter_fields = {
-            "salesperson": "salesperson_name",
-            "itemType": "item_type",
-            "metalType": "metal_type",
-            "customerIntent": "customer_intent",
-            "designPreference": "design_preference",
-            "customerMood": "customer_mood",
-            "storeImpression": "store_impression",
-            "customerSupport": "customer_support",
-            "priceIssue": "reason_price",
-            "sizeIssue": "reason_size"
-        }
-        
-        for filter_key, field_name in filter_fields.items():
-            value = filters.get(filter_key)
-            if value:
-                if value == "Empty":
-                    query[field_name] = {"$in": [None, ""]}
-                elif value != "All":
-                    query[field_name] = value
-        
-        print(f"MongoDB Query: {query}")
-        
-        # Execute query
-        feedback_data = list(collection.find(query).sort("created_at", -1))
+    except Exception as e:
+        logger.error("Error creating indexes: %s", e)
+        return []
+
+def _plan_stages(plan):
+    """Collect the stage names of an explain() plan tree."""
+    stages = [plan["stage"]] if "stage" in plan else []
+    children = [plan[key] for key in ("inputStage", "queryPlan") if key in plan] + plan.get("inputStages", [])
+    for child in children:
+        stages += _plan_stages(child)
+    return stages
+
+def explain_filter_shapes():
+    """
+    Run explain() for the unfiltered query and for each supported filter, with
+    the same sort as iter_filtered_feedback, and flag plans that scan the collection.
+    """
+    collection = get_collection()
+    if collection is None:
+        logger.warning("No MONGO_URI found, nothing to explain")
+        return []
+
+    shapes = [
+        ("(no filter)", {}),
+        ("feedbackId exact", {"feedbackId": "0" * 24}),
+        ("feedbackId prefix", {"feedbackId": "0a1b"}),
+    ] + [(key, {key: "sample"}) for key in FILTER_FIELDS]
+    results = []
+    for name, filters in shapes:
+        query = build_feedback_query(filters)
+        cursor = collection.find(query).sort([("created_at", DESCENDING), ("_id", DESCENDING)]).limit(25)
+        stages = _plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+        results.append({"shape": name, "query": query, "stages": stages, "collection_scan": "COLLSCAN" in stages})
+    return results
+
+def backfill_feedback_ids():
+    """Store feedback_id (the _id as a string) on records saved before it existed."""
+    try:
+        collection = get_collection()
         
+        if collection is None:
+            logger.info("No MONGO_URI found, skipping feedback_id backfill")
+            return 0
+
+        result = collection.update_many(
+            {"feedback_id": {"$exists": False}},
+            [{"$set": {"feedback_id": {"$toString": "$_id"}}}]
+        )
+        if result.modified_count:
+            logger.info("Backfilled feedback_id on %d records", result.modified_count)
+        return result.modified_count
+
+    except Exception as e:
+        logger.error("Error backfilling feedback_id: %s", e)
+        return 0
+
+def feedback_id_query(search_term):
+    """
+    Query for a feedback id search: an exact _id match for a full 24-character
+    id, otherwise an anchored prefix match on the indexed feedback_id field.
+    """
+    search_term = search_term.strip().lower()
+    if OBJECT_ID_PATTERN.fullmatch(search_term):
+        return {"_id": ObjectId(search_term)}
+    # A case-sensitive regex anchored with ^ is answered from the feedback_id index
+    return {"feedback_id": {"$regex": f"^{re.escape(search_term)}"}}
+
+def build_feedback_query(filters, filter_fields=FILTER_FIELDS):
+    """Build the MongoDB query for the dashboard filters named in `filter_fields`."""
+    query = {}
+    
+    # Exact or prefix lookup by feedback id
+    if filters.get("feedbackId"):
+        query.update(feedback_id_query(filters["feedbackId"]))
+    
+    # Field-specific filters
+    for filter_key, field_name in filter_fields.items():
+        value = filters.get(filter_key)
+        if value:
+            if value == "Empty":
+                query[field_name] = {"$in": [None, ""]}
+            elif value != "All":
+                query[field_name] = value
+    
+    return query
+
+def encode_cursor(record):
+    """Opaque keyset cursor pointing just after `record` (created_at, _id)."""
+    created_at = record.get("created_at")
+    payload = {
+        "t": created_at.isoformat() if isinstance(created_at, datetime) else None,
+        "id": str(record["_id"]),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor(). Raises ValueError if it is malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(payload["t"]) if payload["t"] else None
+        return created_at, ObjectId(payload["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def iter_filtered_feedback(filters, limit=None, after=None, sort="-created_at", fields=None):
+    """
+    Yield filtered feedback records straight from the MongoDB cursor.
+    limit:  maximum number of records (None for all)
+    after:  cursor from encode_cursor() of the last record of the previous page
+    sort:   "-created_at" (newest first) or "created_at"
+    fields: list of fields to return; _id and created_at are always included
+    """
+    if sort not in SORT_ORDERS:
+        raise ValueError(f"Unsupported sort: {sort}")
+    direction = SORT_ORDERS[sort]
+
+    collection = get_collection()
+    if collection is None:
+        logger.warning("No MONGO_URI found, returning empty list")
+        return
+
+    logger.debug("Filters received: %s", filters)
+    query = build_feedback_query(filters)
+
+    # Keyset pagination: continue strictly after the (created_at, _id) of the cursor
+    if after:
+        created_at, last_id = decode_cursor(after)
+        op = "$lt" if direction < 0 else "$gt"
+        query = {"$and": [query, {"$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "_id": {op: last_id}},
+        ]}]}
+
+    logger.debug("MongoDB query: %s", query)
+
+    projection = None
+    if fields:
+        projection = {field: 1 for field in fields}
+        projection["created_at"] = 1
+
+    cursor = collection.find(query, projection).sort([("created_at", direction), ("_id", direction)]).batch_size(FEEDBACK_READ_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    count = 0
+    for item in cursor:
         # Convert ObjectId to string for JSON serialization
-        for item in feedback_data:
-            item["_id"] = str(item["_id"])
-        
-        print(f"Retrieved {len(feedback_data)} filtered feedback records")
-        return feedback_data
+        item["_id"] = str(item["_id"])
+        count += 1
+        yield item
+    logger.debug("Retrieved %d filtered feedback records", count)
 
+def get_filtered_feedback(filters, limit=None, after=None, sort="-created_at", fields=None):
+    """Get filtered feedback data based on comprehensive filters."""
+    try:
+        return list(iter_filtered_feedback(filters, limit=limit, after=after, sort=sort, fields=fields))
     except Exception as e:
-        print(f"Error retrieving filtered feedback data: {e}")
+        logger.error("Error retrieving filtered feedback data: %s", e)
         return []
 
+# Fields counted by value for the dashboard stat cards
+STATS_FIELDS = [
+    "purchased",
+    "reason_price",
+    "reason_size",
+    "reason_weight",
+    "reason_zeromaking",
+    "reason_design_outofstock",
+    "reason_design_new",
+    "customer_intent",
+    "customer_mood",
+    "store_impression",
+    "design_preference"
+]
+
+def get_feedback_stats(filters):
+    """
+    Count filtered feedback records by value for each of STATS_FIELDS in a
+    single $facet aggregation. Missing and empty values are counted as "Empty".
+    Returns {"total": n, "counts": {field: {value: count}}}.
+    """
+    stats = {"total": 0, "counts": {field: {} for field in STATS_FIELDS}}
+    try:
+        collection = get_collection()
+        
+        if collection is None:
+            logger.warning("No MONGO_URI found, returning empty stats")
+            return stats
+
+        facets = {"total": [{"$count": "count"}]}
+        for field in STATS_FIELDS:
+            facets[field] = [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+
+        pipeline = [{"$match": build_feedback_query(filters, STATS_FILTER_FIELDS)}, {"$facet": facets}]
+        result = next(collection.aggregate(pipeline), {})
+
+        total = result.get("total") or [{"count": 0}]
+        stats["total"] = total[0]["count"]
+        for field in STATS_FIELDS:
+            for bucket in result.get(field, []):
+                value = bucket["_id"] if bucket["_id"] not in (None, "") else "Empty"
+                counts = stats["counts"][field]
+                counts[str(value)] = counts.get(str(value), 0) + bucket["count"]
+        return stats
+
+    except Exception as e:
+        logger.error("Error retrieving feedback stats: %s", e)
+        return stats
+
 def get_all_feedback():
     """Get all feedback data for the filter table."""
     try:
-        mongo_uri = os.getenv("MONGO_URI")
+        collection = get_collection()
         
-        if not mongo_uri:
-            print("No MONGO_URI found, returning empty list.")
+        if collection is None:
+            logger.warning("No MONGO_URI found, returning empty list")
             return []
 
-        # Connect to MongoDB (Railway)
-        client = MongoClient(mongo_uri)
-        db = client["crm"]
-        collection = db["returned_cust"]
-
         # Get all feedback data
         feedback_data = list(collection.find().sort("created_at", -1))
         
@@ -187,52 +627,67 @@ def get_all_feedback():
         for item in feedback_data:
             item["_id"] = str(item["_id"])
         
-        print(f"Retrieved {len(feedback_data)} feedback records")
+        logger.debug("Retrieved %d feedback records", len(feedback_data))
         return feedback_data
 
     except Exception as e:
-        print(f"Error retrieving feedback data: {e}")
+        logger.error("Error retrieving feedback data: %s", e)
         return []
 
 def delete_feedback_record(feedback_id: str):
     """Delete a specific feedback record."""
     try:
-        mongo_uri = os.getenv("MONGO_URI")
+        collection = get_collection()
         
-        if not mongo_uri:
-            print("No MONGO_URI found, cannot delete.")
+        if collection is None:
+            logger.warning("No MONGO_URI found, cannot delete")
             return False
 
-        # Connect to MongoDB (Railway)
-        client = MongoClient(mongo_uri)
-        db = client["crm"]
-        collection = db["returned_cust"]
-
         # First, get the record to check for image_url
         record = collection.find_one({"_id": ObjectId(feedback_id)})
         
         if not record:
-            print(f"Feedback record not found: {feedback_id}")
+            logger.info("Feedback record not found: %s", feedback_id)
             return False
 
         # Get image_url if it exists
         image_url = record.get("image_url")
-        print(f"[DELETE_DB] Found record with image_url: {image_url}")
-        print(f"[DELETE_DB] image_url type: {type(image_url)}")
         
         # Delete the record
         result = collection.delete_one({"_id": ObjectId(feedback_id)})
         
         if result.deleted_count > 0:
-            print(f"[DELETE_DB] ✓ Deleted feedback record: {feedback_id}")
-            print(f"[DELETE_DB] Returning: deleted=True, image_url={image_url}")
+            logger.info("Deleted feedback record %s (image_url=%s)", feedback_id, image_url)
             
-            # Return image_url if it exists, so the caller can delete the file
-            return {"deleted": True, "image_url": image_url}
+            # Return image_url if it exists, so the caller can delete the file unless
+            # another record stores the same (content-addressed) image
+            image_in_use = bool(image_url) and collection.count_documents({"image_url": image_url}, limit=1) > 0
+            return {"deleted": True, "image_url": image_url, "image_in_use": image_in_use}
         else:
-            print(f"[DELETE_DB] ✗ Failed to delete feedback record: {feedback_id}")
+            logger.warning("Failed to delete feedback record: %s", feedback_id)
             return False
 
     except Exception as e:
-        print(f"Error deleting feedback record: {e}")
+        logger.error("Error deleting feedback record: %s", e)
         return False
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Database maintenance for crm.returned_cust")
+    parser.add_argument("command", choices=["ensure-indexes", "backfill-feedback-ids", "explain", "replay-spool"],
+                        help="ensure-indexes: create the index plan; backfill-feedback-ids: add feedback_id "
+                             "to older records; explain: check query plans for each filter; "
+                             "replay-spool: insert records saved locally while MongoDB was unavailable")
+    args = parser.parse_args()
+
+    if args.command == "ensure-indexes":
+        ensure_indexes()
+    elif args.command == "backfill-feedback-ids":
+        backfill_feedback_ids()
+    elif args.command == "replay-spool":
+        spool_replayer.run_once()
+    else:
+        for result in explain_filter_shapes():
+            flag = "COLLSCAN" if result["collection_scan"] else "ok"
+            print(f"{flag:<9} {result['shape']:<18} {' <- '.join(result['stages'])}")
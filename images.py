@@ -0,0 +1,296 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from dotenv import load_dotenv
+from logging_config import get_logger
+from metrics import stage_timer
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional; without it images are served at full size
+    Image = None
+
+load_dotenv()
+
+logger = get_logger("images")
+
+# Image store configuration
+IMAGES_DIR = Path(os.getenv("IMAGES_DIR", "images")).resolve()
+
+# Image variant configuration
+IMAGE_THUMBNAIL_PX = int(os.getenv("IMAGE_THUMBNAIL_PX", "320"))
+IMAGE_PREVIEW_PX = int(os.getenv("IMAGE_PREVIEW_PX", "1600"))
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+# Downscaled copies stored next to each original as <hash>.<variant>.jpg, plus a
+# smaller <hash>.<variant>.webp served in its place to browsers that accept WebP
+VARIANTS = {"thumb": IMAGE_THUMBNAIL_PX, "preview": IMAGE_PREVIEW_PX}
+VARIANT_SUFFIX = ".jpg"
+WEBP_SUFFIX = ".webp"
+
+CONTENT_TYPE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp", "image/bmp": ".bmp", "image/heic": ".heic"}
+IMAGE_EXTENSIONS = set(CONTENT_TYPE_EXTENSIONS.values()) | {".jpeg", ".heif", ".tif", ".tiff"}
+COPY_CHUNK_BYTES = 1024 * 1024
+
+def variant_name(name, variant):
+    """File name of a variant of a stored image, e.g. ("ab12….png", "thumb") -> "ab12….thumb.jpg"."""
+    return f"{name.split('.', 1)[0]}.{variant}{VARIANT_SUFFIX}"
+
+def _save_atomic(image, path, format, **options):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    image.save(tmp_path, format, **options)
+    os.replace(tmp_path, path)
+
+def variant_urls(image_url):
+    """thumbnail_url and preview_url for a stored image's URL; None for images saved by earlier versions."""
+    urls = {"thumbnail_url": None, "preview_url": None}
+    if not image_url or not str(image_url).startswith("/images/"):
+        return urls
+    name = str(image_url)[len("/images/"):]
+    if not ImageStore.is_content_name(name):
+        return urls
+    urls["thumbnail_url"] = f"/images/{variant_name(name, 'thumb')}"
+    urls["preview_url"] = f"/images/{variant_name(name, 'preview')}"
+    return urls
+
+class ImageStore:
+    """
+    Content-addressed image storage: each image is stored once, as
+    <sha256>.<ext>, so an uploaded photo that is already stored is not
+    written again. Thumbnail and preview variants are generated by a small
+    thread pool after the upload is stored, off the request path.
+
+    Files are sharded by hash prefix (ab/cd/abcd….jpg), so every name maps
+    to one path without listing a directory and no directory grows large.
+    Images saved by earlier versions stay at the top level under their own names.
+    """
+
+    def __init__(self, root, workers=IMAGE_VARIANT_WORKERS):
+        self.root = Path(root)
+        self.workers = max(1, workers)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @staticmethod
+    def is_content_name(name):
+        stem = name.split(".", 1)[0]
+        return len(stem) == 64 and all(c in "0123456789abcdef" for c in stem)
+
+    @staticmethod
+    def is_valid_name(name):
+        """A plain file name inside the store (no path separators, no hidden files)."""
+        return bool(name) and not name.startswith(".") and "/" not in name and "\\" not in name
+
+    def path_for(self, name):
+        """Where a file is stored: sharded for content-addressed names, at the top level otherwise."""
+        if self.is_content_name(name):
+            return self.root / name[:2] / name[2:4] / name
+        return self.root / name
+
+    def _locate(self, name):
+        """Existing path of a file, also checking the top level for content files stored before sharding."""
+        path = self.path_for(name)
+        if path.is_file():
+            return path
+        flat_path = self.root / name
+        if flat_path != path and flat_path.is_file():
+            return flat_path
+        return None
+
+    def iter_names(self):
+        """Names of the stored originals and variants, read one directory at a time."""
+        def walk(directory, depth):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth < 2 and len(entry.name) == 2:
+                            yield from walk(entry.path, depth + 1)
+                    elif entry.is_file():
+                        yield entry.name
+        if self.root.is_dir():
+            yield from walk(self.root, 0)
+
+    def shard_existing(self):
+        """Move content-addressed files from the top level into their shard. Returns the number moved."""
+        moved = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and self.is_content_name(entry.name):
+                    path = self.path_for(entry.name)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(entry.path, path)
+                    moved += 1
+        return moved
+
+    def original_for_variant(self, name):
+        """Path of the original of a variant file name like <hash>.thumb.jpg, or None."""
+        stem, _, rest = name.partition(".")
+        if rest.split(".", 1)[0] not in VARIANTS or not self.is_content_name(stem):
+            return None
+        # One stat per known extension rather than a directory listing
+        for extension in [""] + sorted(IMAGE_EXTENSIONS):
+            path = self._locate(f"{stem}{extension}")
+            if path is not None:
+                return path
+        return None
+
+    def save(self, file_obj, filename, content_type=None):
+        """
+        Store an image from a file object and return its image_data. The file
+        is hashed while it is copied to a temporary file, which is then renamed
+        to its content name (or dropped if that image is already stored).
+        """
+        extension = Path(filename).suffix.lower()
+        if extension not in IMAGE_EXTENSIONS:
+            extension = CONTENT_TYPE_EXTENSIONS.get(content_type, "")
+        self.root.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        file_obj.seek(0)
+        with stage_timer("image_write"):
+            with tempfile.NamedTemporaryFile(dir=self.root, prefix=".upload-", delete=False) as tmp:
+                try:
+                    for chunk in iter(lambda: file_obj.read(COPY_CHUNK_BYTES), b""):
+                        digest.update(chunk)
+                        tmp.write(chunk)
+                        size += len(chunk)
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+                except BaseException:
+                    tmp.close()
+                    os.unlink(tmp.name)
+                    raise
+            name = f"{digest.hexdigest()}{extension}"
+            path = self.path_for(name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            deduplicated = path.exists()
+            if deduplicated:
+                os.unlink(tmp.name)
+            else:
+                os.replace(tmp.name, path)
+
+        logger.info("Image %s %s as %s (%d bytes)", filename, "already stored" if deduplicated else "saved", name, size)
+        self.schedule_variants(name)
+        image_url = f"/images/{name}"
+        return {
+            "filename": filename,
+            "unique_filename": name,
+            "file_path": str(path),
+            "content_type": content_type,
+            "size": size,
+            "image_url": image_url,
+            **variant_urls(image_url),
+            "image_saved": True,
+            "deduplicated": deduplicated,
+        }
+
+    def save_path(self, source_path, content_type=None):
+        """Store an image from a local file (batch ingestion)."""
+        source_path = Path(source_path)
+        with open(source_path, "rb") as f:
+            return self.save(f, source_path.name, content_type)
+
+    def schedule_variants(self, name):
+        """Generate missing variants of an image in the background."""
+        if Image is None:
+            return None
+        if all(self.path_for(variant_name(name, variant)).exists() for variant in VARIANTS):
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-variants")
+            return self._executor.submit(self._generate_variants, name)
+
+    def _generate_variants(self, name):
+        try:
+            with stage_timer("image_variants"), Image.open(self._locate(name)) as image:
+                # Apply the camera's orientation before the EXIF data is dropped
+                image = ImageOps.exif_transpose(image).convert("RGB")
+                for variant, max_px in VARIANTS.items():
+                    path = self.path_for(variant_name(name, variant))
+                    if path.exists():
+                        continue
+                    copy = image.copy()
+                    copy.thumbnail((max_px, max_px), Image.LANCZOS)
+                    # The WebP copy goes first: the .jpg appearing marks the variant as complete
+                    if features.check("webp"):
+                        _save_atomic(copy, path.with_suffix(WEBP_SUFFIX), "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+                    _save_atomic(copy, path, "JPEG", quality=IMAGE_VARIANT_QUALITY, optimize=True, progressive=True)
+            logger.debug("Generated variants of %s", name)
+        except Exception as e:
+            # The original is still served in place of a missing variant
+            logger.warning("Could not generate variants of %s: %s", name, e)
+
+    def lookup(self, name, accept_webp=False):
+        """
+        Find the file to serve for a name under /images/. Returns (path, kind):
+        kind is "original" for a content-addressed image, "variant" for a
+        thumbnail or preview (the WebP copy if accept_webp and it exists),
+        "fallback" for the original served because the variant is missing, or
+        "legacy" for an image saved by an earlier version. Returns (None, None)
+        if nothing matches.
+        """
+        if not self.is_valid_name(name):
+            return None, None
+        stem, _, rest = name.partition(".")
+        if not self.is_content_name(stem):
+            path = self._locate(name)
+            return (path, "legacy") if path else (None, None)
+        if rest.split(".", 1)[0] not in VARIANTS:
+            path = self._locate(name)
+            return (path, "original") if path else (None, None)
+        if accept_webp:
+            webp_path = self._locate(f"{name.rsplit('.', 1)[0]}{WEBP_SUFFIX}")
+            if webp_path is not None:
+                return webp_path, "variant"
+        path = self._locate(name)
+        if path is not None:
+            return path, "variant"
+        original = self.original_for_variant(name)
+        return (original, "fallback") if original else (None, None)
+
+    def delete(self, name):
+        """Delete an image and its variants. Returns True if the original existed."""
+        if not self.is_valid_name(name):
+            return False
+        stem = name.split(".", 1)[0]
+        names = [name] + [variant_name(name, variant) for variant in VARIANTS]
+        names += [f"{stem}.{variant}{WEBP_SUFFIX}" for variant in VARIANTS]
+        existed = False
+        for file_name in names:
+            path = self._locate(file_name)
+            if path is not None:
+                path.unlink(missing_ok=True)
+                existed = existed or file_name == name
+        return existed
+
+    def close(self, wait=True):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintenance for the image store")
+    parser.add_argument("command", choices=["shard", "variants"],
+                        help="shard: move content-addressed images from the top level into hash-prefix "
+                             "directories; variants: generate missing thumbnails and previews")
+    args = parser.parse_args()
+
+    store = ImageStore(IMAGES_DIR)
+    if args.command == "shard":
+        logger.info("Moved %d image(s) into shards", store.shard_existing())
+    else:
+        names = [name for name in store.iter_names() if store.is_content_name(name) and name.count(".") <= 1]
+        for name in names:
+            store.schedule_variants(name)
+        store.close()
+        logger.info("Checked variants of %d image(s)", len(names))
@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+from logging_config import get_logger, set_request_id, reset_request_id
+
+load_dotenv()
+
+logger = get_logger("jobs")
+
+# Job storage configuration
+JOBS_DIR = Path(os.getenv("JOBS_DIR", "job_data")).resolve()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A running job is owned by one process for this long; the owner renews the
+# lease while it works, and a job whose lease ran out is queued again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+class JobQueue:
+    """
+    Background queue for audio processing jobs.
+    Jobs and their uploads are kept in a SQLite database and a local folder,
+    so queued jobs survive a restart. A bounded pool of worker threads runs
+    `handler(job)` for each job and stores whatever dict it returns.
+
+    Several processes can share a job store. A claimed job records its owner
+    and a lease that the owner renews while it runs; only jobs whose lease
+    has expired (their process stopped) are queued again.
+    """
+
+    def __init__(self, handler, jobs_dir=JOBS_DIR, workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS):
+        self.handler = handler
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.jobs_dir = Path(jobs_dir)
+        self.uploads_dir = self.jobs_dir / "uploads"
+        self.db_path = self.jobs_dir / "jobs.db"
+        self.workers = max(1, workers)
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start(self):
+        """Create the job store, requeue interrupted jobs and start the workers."""
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT,
+                    audio_path TEXT,
+                    image_data TEXT,
+                    mode TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    owner TEXT,
+                    lease_expires REAL
+                )
+            """)
+            # Stores created before leases existed
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_expires", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            # Jobs of processes that stopped while running them are picked up again
+            requeued = self._requeue_expired(conn)
+        if requeued:
+            logger.info("Requeued %d interrupted job(s)", requeued)
+
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._renew_leases, name="job-lease", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info("Started %d worker(s), store: %s", self.workers, self.jobs_dir)
+
+    def stop(self, timeout=5):
+        """Stop the workers; jobs still running are requeued once their lease expires."""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, audio_file, filename, image_data=None, mode=None):
+        """Copy an uploaded file object to the job store and queue it. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        audio_path = self.uploads_dir / f"{job_id}{Path(filename).suffix}"
+        audio_file.seek(0)
+        with open(audio_path, "wb") as f:
+            shutil.copyfileobj(audio_file, f, 1024 * 1024)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, audio_path, image_data, mode, created_at) VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, filename, str(audio_path), json.dumps(image_data) if image_data else None, mode, datetime.utcnow().isoformat()),
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """Return the public view of a job, or None if it does not exist."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "filename": row["filename"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+        }
+
+    def _requeue_expired(self, conn):
+        """Queue running jobs whose lease has expired (or that were claimed before leases existed) again."""
+        return conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, lease_expires = NULL "
+            "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)",
+            (time.time(),),
+        ).rowcount
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running under this queue's lease, across threads and processes."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            requeued = self._requeue_expired(conn)
+            if requeued:
+                logger.info("Requeued %d job(s) whose lease expired", requeued)
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, lease_expires = ? WHERE id = ?",
+                    (datetime.utcnow().isoformat(), self.owner, time.time() + self.lease_seconds, row["id"]),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        job = dict(row)
+        job["image_data"] = json.loads(job["image_data"]) if job["image_data"] else None
+        return job
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires = NULL WHERE id = ? AND owner = ?",
+                (status, json.dumps(result, default=str) if result is not None else None, error, datetime.utcnow().isoformat(), job_id, self.owner),
+            ).rowcount
+        if not updated:
+            logger.warning("Lease of job %s expired before it finished; it was handed to another worker", job_id)
+
+    def _renew_leases(self):
+        """Extend the lease of every job this queue is running, several times per lease period."""
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET lease_expires = ? WHERE status = 'running' AND owner = ?",
+                        (time.time() + self.lease_seconds, self.owner),
+                    )
+            except Exception as e:
+                logger.error("Could not renew job leases: %s", e)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                logger.error("Could not claim a job: %s", e)
+                job = None
+            if not job:
+                # Woken up by submit(); the timeout also picks up jobs queued by other processes
+                with self._wakeup:
+                    self._wakeup.wait(JOB_POLL_SECONDS)
+                continue
+
+            # Log lines of this job carry its id
+            token = set_request_id(job["id"][:12])
+            logger.info("Processing job %s (%s)", job["id"], job["filename"])
+            try:
+                result = self.handler(job)
+                if result.get("status") == "error":
+                    self._finish(job["id"], "failed", result=result, error=result.get("error"))
+                else:
+                    self._finish(job["id"], "done", result=result)
+                    Path(job["audio_path"]).unlink(missing_ok=True)
+            except Exception as e:
+                logger.exception("Job %s failed", job["id"])
+                self._finish(job["id"], "failed", error=str(e))
+            finally:
+                reset_request_id(token)
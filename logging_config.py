@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Logging configuration
+# LOG_LEVEL: DEBUG adds payload dumps (records, prompts, transcripts); INFO keeps one line per step
+# LOG_FORMAT: "text" for humans, "json" for one JSON object per line
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+
+# Id of the request, job or batch item being processed; "-" outside of one
+_request_id = ContextVar("request_id", default="-")
+
+def get_request_id():
+    return _request_id.get()
+
+def set_request_id(request_id=None):
+    """Set the id for the current context (a new one if not given). Returns a token for reset_request_id."""
+    return _request_id.set(request_id or uuid.uuid4().hex[:12])
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with extra={...} are included."""
+
+    STANDARD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "request_id", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": record.request_id,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.STANDARD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Set up the "crm" logger that all modules log under. Safe to call more than once."""
+    logger = logging.getLogger("crm")
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.addFilter(RequestIdFilter())
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(request_id)s] %(name)s: %(message)s"))
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+def get_logger(name):
+    """Logger for a module, e.g. get_logger("agent") -> "crm.agent"."""
+    return logging.getLogger(f"crm.{name}")
+
+configure_logging()
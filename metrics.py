@@ -0,0 +1,59 @@
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Stage durations, from milliseconds (image write, Mongo insert) to minutes (long recordings)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# Stages: upload_read, image_write, image_variants (thumbnail and preview, in the background),
+# convert, whisper, llm_extract, mongo_insert, mongo_insert_many (one write-behind batch)
+STAGE_SECONDS = Histogram(
+    "crm_stage_duration_seconds",
+    "Time spent in each stage of processing a recording",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+# Kinds: save_to_json (record written to the local spool instead of MongoDB),
+# partial_success (pipeline failed, fallback record saved), fallback_failed (nothing saved)
+FALLBACKS = Counter(
+    "crm_fallbacks_total",
+    "Times a recording or record took a fallback path",
+    ["kind"],
+)
+
+RECORDINGS = Counter(
+    "crm_recordings_processed_total",
+    "Recordings processed, by result status",
+    ["status"],
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "crm_requests_in_flight",
+    "Upload requests currently being handled",
+    ["endpoint"],
+)
+
+PIPELINES_IN_FLIGHT = Gauge(
+    "crm_pipelines_in_flight",
+    "Recordings currently going through the pipeline (requests, jobs and batches)",
+)
+
+INSERT_BUFFER_PENDING = Gauge(
+    "crm_insert_buffer_pending",
+    "Feedback records queued for a write-behind insert_many",
+)
+
+SPOOL_REPLAYED = Counter(
+    "crm_spool_replayed_records_total",
+    "Spooled feedback records replayed into MongoDB",
+)
+
+def stage_timer(stage):
+    """Context manager that records the duration of a block in the stage histogram."""
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+def render():
+    """Current metrics in Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
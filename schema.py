@@ -0,0 +1,197 @@
+"""
+The CRM feedback record: one declaration of its fields, used to build the
+extraction prompt, the null-filled default record and the normalizer that
+coerces model output to valid values.
+"""
+
+import re
+from dataclasses import dataclass
+from cache import content_hash
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    kind: str  # "enum", "number" or "string"
+    values: tuple = ()
+    note: str = None  # Extra instruction for the model about this field
+    required: bool = False  # Described to the model as never null
+
+YES_NO = ("Yes", "No")
+
+FIELDS = (
+    Field("purchased", "enum", YES_NO),
+    Field("salesperson_name", "string"),
+    Field("item_type", "enum", ("Bangle", "Chain", "Bracelet", "Necklace", "Earring", "Ring", "Pendant Set", "Stud", "Locket", "Hand Chain", "Nose Pin", "Mangal Sutra", "Thali", "Band Ring")),
+    Field("metal_type", "enum", ("22K", "18K", "24K", "Diamond", "Other")),
+    Field("reason_price", "enum", YES_NO),
+    Field("reason_size", "enum", YES_NO),
+    Field("reason_weight", "enum", YES_NO),
+    Field("reason_zeromaking", "enum", YES_NO),
+    Field("reason_design_outofstock", "enum", YES_NO, note="Customer wanted a design that exists in catalog but is currently out of stock"),
+    Field("reason_design_new", "enum", YES_NO, note="Customer requested a new/custom design that does not exist in the catalog"),
+    Field("required_size", "number"),
+    Field("required_weight", "number"),
+    Field("available_size", "number"),
+    Field("available_weight", "number"),
+    Field("asked_price", "number"),
+    Field("given_price", "number"),
+    Field("design_type", "enum", ("Coins / Bars", "Daily Wear", "Custom Order", "Bridal jewellery", "Kids Jewellery", "Men's Jewellery", "Temple", "Antique", "Turkish", "Calcutta", "Delhi", "Rajkot", "Local", "Singapore", "Bombay", "Italian")),
+    Field("item_category", "string"),
+    Field("customer_intent", "enum", ("Just Looking", "Serious Buyer", "Price Checking", "Return Customer")),
+    Field("is_previous_cust", "enum", YES_NO),
+    Field("type_of_customer", "enum", ("tourist", "resident", "none")),
+    Field("M_Source", "enum", ("walkin", "Social Media", "Social Groups", "Whatsup Groups", "Corporates", "Residential Cmty", "Local Cmty", "HNTW", "Hotels", "Tourism Companies", "Tour Drivers", "Other Tours Assctd cmpy", "DGJG", "Product Launch", "Other", "none")),
+    Field("M_source_Tag", "string"),
+    Field("design_preference", "enum", ("Liked", "Disliked", "Neutral")),
+    Field("store_impression", "enum", ("Good", "Poor", "Neutral")),
+    Field("customer_mood", "enum", ("Happy", "Frustrated", "Neutral", "Disappointed")),
+    Field("customer_support", "enum", ("Excellent", "Good", "Average", "Poor")),
+    Field("purchase_satisfaction", "enum", ("Very Satisfied", "Satisfied", "Neutral", "Dissatisfied")),
+    Field("waiting_time", "enum", ("Very Fast", "Fast", "Average", "Slow", "Very Slow")),
+    Field("original_text", "string", required=True),
+    Field("contact_number", "string"),
+)
+
+# Extracted fields plus image_url, which is set from the upload and never by the model
+FIELD_NAMES = tuple(field.name for field in FIELDS)
+RECORD_FIELDS = FIELD_NAMES + ("image_url",)
+
+IMAGE_ONLY_PREFIX = "Image-only upload:"
+
+def default_record(original_text=None, image_url=None):
+    """A record with every field set to null."""
+    record = dict.fromkeys(RECORD_FIELDS)
+    record["original_text"] = original_text
+    record["image_url"] = image_url
+    return record
+
+# ---- PROMPT ----
+def _field_spec(field):
+    if field.kind == "enum":
+        return " | ".join(f'"{value}"' for value in field.values) + " | null"
+    if field.kind == "number":
+        return "number or null"
+    return "string" if field.required else "string or null"
+
+def _static_prompt():
+    """
+    Everything that does not depend on the recording. It is sent first and is
+    identical for every request, so the provider can cache it as a prompt prefix.
+    """
+    spec = ",\n".join(f'    "{field.name}": {_field_spec(field)}' for field in FIELDS)
+    notes = "\n".join(f'- "{field.name}": {field.note}' for field in FIELDS if field.note)
+    return f"""You are an assistant that extracts structured feedback data from jewellery store customer conversations.
+
+Extract as JSON with the following fields:
+{{
+{spec}
+}}
+
+Important distinction for design fields:
+{notes}
+
+If a field is not mentioned, set it to null.
+"original_text" is the analyzed text, unchanged.
+If the input is an image-only upload, analyze the image context and extract any visible information about:
+- Jewelry items shown
+- Customer interactions
+- Store environment
+- Any text or labels visible in the image
+If a field cannot be determined from the image, set it to null.
+
+Return ONLY valid JSON without any markdown formatting or code blocks.
+"""
+
+PROMPT_PREFIX = _static_prompt()
+
+def build_prompt(feedback_text, image_filename=None):
+    """
+    The extraction prompt: the static PROMPT_PREFIX, then the parts that vary per
+    recording (image context last but one, the transcript last).
+    """
+    parts = [PROMPT_PREFIX]
+    if feedback_text.startswith(IMAGE_ONLY_PREFIX):
+        parts.append(f"An image file '{image_filename}' has been uploaded for customer feedback analysis.")
+    elif image_filename:
+        parts.append(f"An image file '{image_filename}' is also provided for additional context. Include any relevant image information in the feedback.")
+    parts.append(f'Analyze this text:\n"{feedback_text}"')
+    return "\n".join(parts)
+
+# ---- NORMALIZER ----
+def _key(value):
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+# Spellings the model uses for yes/no answers
+_YES_NO_SYNONYMS = {"true": "Yes", "y": "Yes", "false": "No", "n": "No"}
+# Values meaning "not mentioned" (unless the field has a literal "none" value)
+_NULL_VALUES = {"", "null", "none", "na", "nan", "unknown", "notmentioned"}
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+# Lookup tables built once: normalized spelling -> canonical value, per enum field
+_ENUM_LOOKUP = {}
+for _field in FIELDS:
+    if _field.kind == "enum":
+        lookup = {_key(value): value for value in _field.values}
+        if _field.values == YES_NO:
+            lookup.update(_YES_NO_SYNONYMS)
+        _ENUM_LOOKUP[_field.name] = lookup
+
+def _normalize_enum(name, value):
+    if isinstance(value, bool):
+        value = "Yes" if value else "No"
+    key = _key(value)
+    canonical = _ENUM_LOOKUP[name].get(key)
+    if canonical is None and key not in _NULL_VALUES:
+        return None, value
+    return canonical, None
+
+def _normalize_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    match = _NUMBER.search(str(value).replace(",", ""))
+    if not match:
+        return None
+    number = float(match.group())
+    return int(number) if number.is_integer() else number
+
+def _normalize_string(value):
+    if isinstance(value, (dict, list)):
+        return None
+    value = str(value).strip()
+    return None if _key(value) in _NULL_VALUES else value
+
+_KIND = {field.name: field.kind for field in FIELDS}
+
+def normalize_record(data, original_text=None, image_url=None):
+    """
+    Coerce extracted data to the schema: every field present, enum values mapped
+    to their canonical spelling (case, spacing and punctuation are ignored),
+    numbers parsed from strings like "22 g" or "45,000", unknown keys dropped.
+    Returns (record, rejected) where rejected maps fields to values that were set to null.
+    """
+    record = default_record(original_text, image_url)
+    rejected = {}
+    for name, value in data.items():
+        if name not in _KIND or value is None:
+            continue
+        kind = _KIND[name]
+        if kind == "enum":
+            record[name], invalid = _normalize_enum(name, value)
+            if invalid is not None:
+                rejected[name] = invalid
+        elif kind == "number":
+            record[name] = _normalize_number(value)
+            if record[name] is None:
+                rejected[name] = value
+        else:
+            record[name] = _normalize_string(value)
+    if not record["original_text"]:
+        record["original_text"] = original_text
+    return record, rejected
+
+# Changes whenever the prompt or the field declarations change; used to version cached extractions
+SCHEMA_VERSION = content_hash(
+    (PROMPT_PREFIX + build_prompt("\x00transcript\x00", "\x00image\x00") + repr(FIELDS)).encode("utf-8")
+)[:16]
@@ -0,0 +1,312 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+from logging_config import get_logger
+from metrics import SPOOL_REPLAYED
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+load_dotenv()
+
+logger = get_logger("spool")
+
+# Spool configuration
+SPOOL_DIR = Path(os.getenv("SPOOL_DIR", "feedback_data/spool")).resolve()
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+SPOOL_REPLAY_INTERVAL_SECONDS = float(os.getenv("SPOOL_REPLAY_INTERVAL_SECONDS", "30"))
+SPOOL_REPLAY_BATCH_SIZE = int(os.getenv("SPOOL_REPLAY_BATCH_SIZE", "500"))
+
+DUPLICATE_KEY = 11000
+
+# Segments are written as segment-<writer>-<number>.open and renamed to .jsonl
+# once closed; only closed segments are replayed
+OPEN_SUFFIX = ".open"
+READY_SUFFIX = ".jsonl"
+FAILED_DIR_NAME = "failed"
+# An .open segment nobody holds a lock on is left by a process that died; it is
+# only taken over once it is this old, so a writer that has just created it can lock it first
+ORPHAN_GRACE_SECONDS = 60
+
+# One-file-per-record fallback written by earlier versions, replayed alongside the spool
+LEGACY_DIR = Path("feedback_data").resolve()
+LEGACY_PATTERN = "feedback_*.json"
+
+def _try_lock(file):
+    """Take an exclusive lock on an open file without waiting. Released when the file is closed or the process exits."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+class Spool:
+    """
+    Append-only JSONL log of feedback records that could not be written to
+    MongoDB. Records go to numbered segment files, a new one once the current
+    segment reaches SPOOL_SEGMENT_BYTES. append() returns after the record is
+    fsynced; appends that arrive while an fsync is running share the next one.
+
+    Several processes (uvicorn workers) can share a spool directory: each
+    writes its own segments, named after a writer id, and holds a lock on
+    the one it is appending to. A segment is renamed from .open to .jsonl
+    when it is closed, and replay() only reads closed segments, plus .open
+    segments left unlocked by a process that died.
+
+    replay() inserts spooled records into a collection and deletes segments
+    once all their records are stored. Records keep the _id they were given
+    before spooling and duplicate keys count as stored, so replaying the same
+    segment twice (e.g. after a crash mid-replay) does not duplicate records.
+    A segment with records the database rejects, or a legacy file that
+    cannot be read, is moved to failed/.
+    """
+
+    def __init__(self, spool_dir=SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, legacy_dir=LEGACY_DIR):
+        self.spool_dir = Path(spool_dir)
+        self.legacy_dir = Path(legacy_dir)
+        self.failed_dir = self.spool_dir / FAILED_DIR_NAME
+        self.segment_bytes = segment_bytes
+        self.writer_id = None
+        self._writer_pid = None
+        self._number = 0
+        self._lock = threading.Lock()  # Guards the active segment and the write counters
+        self._sync_lock = threading.Lock()  # One fsync at a time
+        self._replay_lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._written = 0  # Appends written to the active segment
+        self._synced = 0  # Appends covered by an fsync
+
+    def _segments(self):
+        """Closed segments, ready to be replayed."""
+        return sorted(self.spool_dir.glob(f"segment-*{READY_SUFFIX}"))
+
+    def _open_segments(self):
+        return sorted(self.spool_dir.glob(f"segment-*{OPEN_SUFFIX}"))
+
+    def _open_segment(self):
+        """Start a new segment of this writer; segments are never reopened."""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        if self._writer_pid != os.getpid():
+            # Set on first use, so each forked worker gets its own id
+            self._writer_pid = os.getpid()
+            self.writer_id = f"{self._writer_pid}-{uuid.uuid4().hex[:8]}"
+            self._number = 0
+        self._number += 1
+        self._path = self.spool_dir / f"segment-{self.writer_id}-{self._number:08d}{OPEN_SUFFIX}"
+        self._file = open(self._path, "ab")
+        if not _try_lock(self._file):
+            self._file.close()
+            raise OSError(f"Could not lock spool segment {self._path}")
+        self._written = self._synced = 0
+
+    def _close_segment(self):
+        """Close the active segment and mark it ready to be replayed. Call with _lock held."""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._path, self._path.with_suffix(READY_SUFFIX))
+            self._file = None
+            self._path = None
+
+    def close(self):
+        """Close the active segment, e.g. at shutdown, so any process can replay it."""
+        with self._lock:
+            self._close_segment()
+
+    def _adopt_orphans(self):
+        """Mark .open segments left by processes that died as ready. Segments other writers hold are skipped."""
+        for path in self._open_segments():
+            if path == self._path:
+                continue
+            try:
+                if time.time() - path.stat().st_mtime < ORPHAN_GRACE_SECONDS:
+                    continue
+                with open(path, "rb+") as f:
+                    if not _try_lock(f):
+                        continue  # A live writer is still appending to it
+            except FileNotFoundError:
+                continue  # Closed or adopted meanwhile
+            try:
+                os.replace(path, path.with_suffix(READY_SUFFIX))
+                logger.info("Took over %s from a stopped process", path.name)
+            except FileNotFoundError:
+                pass
+
+    def append(self, record):
+        """Write a record to the spool and wait until it is on disk. Returns the segment path."""
+        line = json_util.dumps(record, json_options=json_util.RELAXED_JSON_OPTIONS, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._close_segment()
+                self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            self._written += 1
+            sequence, file, path = self._written, self._file, self._path
+        self._sync(file, sequence)
+        return str(path)
+
+    def _sync(self, file, sequence):
+        with self._sync_lock:
+            with self._lock:
+                if file is not self._file:
+                    return  # Rotated: the segment was fsynced when it was closed
+                if self._synced >= sequence:
+                    return  # Covered by an fsync another append ran
+                target = self._written
+            os.fsync(file.fileno())
+            with self._lock:
+                if file is self._file:
+                    self._synced = max(self._synced, target)
+
+    def pending(self):
+        """Number of segment and legacy files waiting to be replayed, including segments still being written."""
+        return len(self._segments()) + len(self._open_segments()) + len(list(self.legacy_dir.glob(LEGACY_PATTERN)))
+
+    def replay(self, collection, batch_size=SPOOL_REPLAY_BATCH_SIZE):
+        """
+        Insert every spooled record into `collection`. A segment with records
+        the database rejects, or an unreadable legacy file, is moved to failed/
+        and the replay goes on; any other error (e.g. the database is
+        unreachable) stops the replay and the file is retried on the next one.
+        Returns the number of records stored.
+        """
+        with self._replay_lock:
+            with self._lock:
+                # Appends from here on go to a new segment, which is left for the next replay
+                self._close_segment()
+            self._adopt_orphans()
+            stored = 0
+            for segment in self._segments():
+                try:
+                    records = self._read_segment(segment)
+                except FileNotFoundError:
+                    continue  # Replayed by another process meanwhile
+                if self._store(collection, records, batch_size, segment):
+                    stored += len(records)
+                    segment.unlink(missing_ok=True)
+                    logger.info("Replayed %s", segment.name)
+            for path in sorted(self.legacy_dir.glob(LEGACY_PATTERN)):
+                try:
+                    record = _legacy_record(path)
+                except FileNotFoundError:
+                    continue  # Replayed by another process meanwhile
+                except (ValueError, OSError) as e:
+                    # e.g. truncated by a crash while it was written; it would fail on every replay
+                    self._park(path, f"unreadable: {e}")
+                    continue
+                if self._store(collection, [record], batch_size, path):
+                    stored += 1
+                    path.unlink(missing_ok=True)
+            if stored:
+                logger.info("Replayed %d spooled record(s) into MongoDB", stored)
+            return stored
+
+    def _read_segment(self, segment):
+        records = []
+        with open(segment, "rb") as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    records.append(json_util.loads(line))
+                except (ValueError, UnicodeDecodeError):
+                    # Only a crash mid-write leaves a partial line, and that record was never acknowledged
+                    logger.warning("Skipping unreadable line %d of %s", number, segment.name)
+        return records
+
+    def _store(self, collection, records, batch_size, path):
+        """Insert the records of one file. Returns False, after moving the file to failed/, if any was rejected."""
+        rejected = []
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            try:
+                collection.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: every record without an error in the list was stored
+                errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+                rejected.extend(errors)
+                SPOOL_REPLAYED.inc(len(batch) - len(errors))
+                continue
+            SPOOL_REPLAYED.inc(len(batch))
+        if not rejected:
+            return True
+        self._park(path, f"{len(rejected)} record(s) rejected, first error: {rejected[0].get('errmsg')}")
+        return False
+
+    def _park(self, path, reason):
+        """Move a file that cannot be replayed to failed/, so it does not hold up the files after it."""
+        self.failed_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(path, self.failed_dir / path.name)
+        logger.error("Moved %s to %s: %s", path.name, self.failed_dir, reason)
+
+def _legacy_record(path):
+    """Read a legacy fallback file, with an _id derived from its content so re-imports are idempotent."""
+    with open(path, "rb") as f:
+        content = f.read()
+    record = json.loads(content)
+    if "_id" in record and ObjectId.is_valid(str(record["_id"])):
+        record["_id"] = ObjectId(str(record["_id"]))
+    else:
+        record["_id"] = ObjectId(hashlib.sha256(content).digest()[:12])
+    record["feedback_id"] = str(record["_id"])
+    # Legacy files stored created_at as text (or not at all)
+    try:
+        record["created_at"] = datetime.fromisoformat(record["created_at"])
+    except (KeyError, TypeError, ValueError):
+        record["created_at"] = datetime.utcfromtimestamp(path.stat().st_mtime)
+    return record
+
+class SpoolReplayer:
+    """Background thread that replays the spool whenever MongoDB is reachable."""
+
+    def __init__(self, spool, collection_getter, interval=SPOOL_REPLAY_INTERVAL_SECONDS):
+        self.spool = spool
+        self.collection_getter = collection_getter
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spool-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self):
+        """Replay if there is anything spooled and a database is configured. Returns records stored."""
+        if not self.spool.pending():
+            return 0
+        collection = self.collection_getter()
+        if collection is None:
+            return 0
+        return self.spool.replay(collection)
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning("Spool replay failed, retrying in %.0f s: %s", self.interval, e)
+            self._stop.wait(max(0, self.interval - (time.monotonic() - start)))
@@ -0,0 +1,41 @@
+"""
+Runs the app in-process with the fake backends and an in-memory MongoDB.
+Needs: pip install pytest httpx mongomock
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Configure the stand-ins before the app modules are imported; files go to a scratch folder
+_scratch = tempfile.mkdtemp(prefix="crm-tests-")
+os.environ.update({
+    "CRM_BACKEND": "fake",
+    "TRANSCRIPTION_BACKEND": "fake",
+    "EXTRACTION_BACKEND": "fake",
+    "FAKE_TRANSCRIBE_LATENCY_MS": "50",
+    "FAKE_EXTRACT_LATENCY_MS": "50",
+    "FAKE_LATENCY_JITTER_MS": "50",
+    "TRANSCRIPT_CACHE_DIR": "",
+    "MONGO_URI": "mongodb://tests",
+    "IMAGES_DIR": os.path.join(_scratch, "images"),
+    "SPOOL_DIR": os.path.join(_scratch, "spool"),
+    "JOBS_DIR": os.path.join(_scratch, "jobs"),
+    "BATCH_DIR": os.path.join(_scratch, "batches"),
+})
+
+@pytest.fixture
+def app_client():
+    """An httpx.AsyncClient factory for the app, with a fresh in-memory database."""
+    httpx = pytest.importorskip("httpx")
+    mongomock = pytest.importorskip("mongomock")
+    import db
+    import app
+
+    db._client = mongomock.MongoClient()
+    yield lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://tests", timeout=60)
+    db._client = None
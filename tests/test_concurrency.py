@@ -0,0 +1,33 @@
+"""Concurrent uploads must never mix up their audio, image or saved record."""
+
+import asyncio
+import hashlib
+import os
+
+UPLOADS = 24
+
+def test_concurrent_uploads_keep_their_own_data(app_client):
+    uploads = [(os.urandom(2048), os.urandom(512)) for _ in range(UPLOADS)]
+
+    async def run():
+        async with app_client() as client:
+            return await asyncio.gather(*(
+                client.post("/process_audio", files={
+                    "file": (f"visit_{i}.webm", audio, "audio/webm"),
+                    "image": (f"visit_{i}.png", image, "image/png"),
+                })
+                for i, (audio, image) in enumerate(uploads)
+            ))
+
+    responses = asyncio.run(run())
+
+    import db
+    stored = {record["original_text"]: record for record in db.get_collection().find()}
+    assert len(stored) == UPLOADS
+    for (audio, image), response in zip(uploads, responses):
+        assert response.status_code == 200
+        feedback = response.json()["agent_result"]["feedback"]
+        # The fake transcript names the hash of the audio it was given; images are stored by content hash
+        assert hashlib.sha256(audio).hexdigest()[:12] in feedback["original_text"]
+        assert feedback["image_url"] == f"/images/{hashlib.sha256(image).hexdigest()}.png"
+        assert stored[feedback["original_text"]]["image_url"] == feedback["image_url"]
@@ -0,0 +1,58 @@
+"""Uploads in progress must not stall the event loop or the threads other endpoints use."""
+
+import asyncio
+import itertools
+import os
+import time
+
+import backends
+
+UPLOADS_IN_FLIGHT = 48  # More than the shared threadpool's 40 threads
+WARMUP_SECONDS = 0.5
+PROBE_SECONDS = 2
+MAX_HEALTH_P99_MS = 50
+MAX_STATS_P99_MS = 500
+
+def p99(latencies):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+async def probe(client, path):
+    latencies = []
+    deadline = time.perf_counter() + PROBE_SECONDS
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(path)
+        assert response.status_code == 200
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return latencies
+
+def test_health_latency_stays_flat_during_uploads(app_client):
+    # Slow pipelines, so every upload holds a thread for the whole measurement
+    backends.set_backends(backends.FakeTranscriber(latency_ms=800), backends.FakeExtractor(latency_ms=1200))
+    counter = itertools.count()
+
+    async def upload_until(stop, client):
+        while not stop.is_set():
+            response = await client.post("/process_audio", files={"file": (f"visit_{next(counter)}.webm", os.urandom(1024), "audio/webm")})
+            assert response.status_code == 200
+
+    async def run():
+        async with app_client() as client:
+            stop = asyncio.Event()
+            uploaders = [asyncio.create_task(upload_until(stop, client)) for _ in range(UPLOADS_IN_FLIGHT)]
+            await asyncio.sleep(WARMUP_SECONDS)
+            try:
+                return await asyncio.gather(probe(client, "/health"), probe(client, "/api/feedback/stats"))
+            finally:
+                stop.set()
+                await asyncio.gather(*uploaders)
+
+    try:
+        health, stats = asyncio.run(run())
+    finally:
+        backends.set_backends(backends.FakeTranscriber(), backends.FakeExtractor())
+
+    assert p99(health) < MAX_HEALTH_P99_MS
+    assert p99(stats) < MAX_STATS_P99_MS
@@ -0,0 +1,60 @@
+"""Spool replay stores every record once and parks files it cannot replay."""
+
+import json
+import shutil
+
+import pytest
+from bson import ObjectId
+
+from spool import Spool
+
+@pytest.fixture
+def collection():
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient().crm.returned_cust
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(tmp_path / "spool", legacy_dir=tmp_path / "legacy")
+
+def test_replaying_a_segment_twice_stores_each_record_once(spool, collection, tmp_path):
+    ids = [ObjectId() for _ in range(3)]
+    for record_id in ids:
+        spool.append({"_id": record_id, "original_text": str(record_id)})
+    spool.close()
+    # A crash after the inserts but before the segment was deleted leaves it to be replayed again
+    segment = next(spool.spool_dir.glob("segment-*.jsonl"))
+    shutil.copy(segment, tmp_path / segment.name)
+
+    assert spool.replay(collection) == 3
+    shutil.copy(tmp_path / segment.name, segment)
+    assert spool.replay(collection) == 3
+
+    assert sorted(record["_id"] for record in collection.find()) == sorted(ids)
+    assert not list(spool.spool_dir.glob("segment-*"))
+
+def test_duplicate_id_counts_as_stored(spool, collection):
+    existing = ObjectId()
+    collection.insert_one({"_id": existing, "original_text": "already stored"})
+    spool.append({"_id": existing, "original_text": "already stored"})
+    spool.append({"_id": ObjectId(), "original_text": "new"})
+
+    assert spool.replay(collection) == 2
+    assert collection.count_documents({}) == 2
+    assert not list(spool.spool_dir.glob("segment-*"))
+    assert not spool.failed_dir.exists()
+
+def test_unreadable_legacy_file_is_parked(spool, collection):
+    spool.legacy_dir.mkdir()
+    # save_to_json of earlier versions could be interrupted halfway through a record
+    truncated = spool.legacy_dir / "feedback_20240101_000000.json"
+    truncated.write_text('{"a":1,"created_at": ')
+    valid = spool.legacy_dir / "feedback_20240102_000000.json"
+    valid.write_text(json.dumps({"original_text": "kept", "created_at": "2024-01-02T00:00:00"}))
+
+    assert spool.replay(collection) == 1
+    assert collection.find_one()["original_text"] == "kept"
+    assert (spool.failed_dir / truncated.name).exists()
+    assert not truncated.exists() and not valid.exists()
+    # The next replay has nothing left to do
+    assert spool.replay(collection) == 0
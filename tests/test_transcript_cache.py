@@ -0,0 +1,27 @@
+"""A recording uploaded again reuses its transcript without being converted again."""
+
+import io
+import os
+
+import pytest
+
+def test_repeated_upload_skips_conversion(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    import agent
+    import db
+
+    monkeypatch.setattr(db, "_client", mongomock.MongoClient())
+    conversions = []
+    convert = agent.convert_audio_format
+    monkeypatch.setattr(agent, "convert_audio_format", lambda *args: conversions.append(args) or convert(*args))
+
+    audio = os.urandom(2048)
+    results = [
+        agent.process_recording(io.BytesIO(audio), "visit.webm", mode="direct")
+        for _ in range(2)
+    ]
+
+    assert [result["status"] for result in results] == ["success", "success"]
+    assert len(conversions) == 1
+    assert results[0]["agent_result"]["transcript"] == results[1]["agent_result"]["transcript"]
+    assert "convert" not in results[1]["agent_result"]["timings_ms"]